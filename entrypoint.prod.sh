@@ -1,4 +1,7 @@
 
 python manage.py collectstatic --noinput
-python manage.py migrate
-python -m gunicorn --bind 0.0.0.0:8000 puspanjali_backend.wsgi:application
\ No newline at end of file
+# Migrations run once per release in predeploy.sh, not in every web container.
+if [ "$MIGRATE_ON_START" = "True" ]; then
+    sh predeploy.sh
+fi
+python -m gunicorn --config gunicorn.conf.py puspanjali_backend.wsgi:application
@@ -0,0 +1,67 @@
+# gunicorn.conf.py
+# Production server settings, every value can be overridden from the environment.
+import gc
+import multiprocessing
+import os
+
+
+def env_int(name, default):
+    value = os.getenv(name)
+    return int(value) if value else default
+
+
+def env_bool(name, default):
+    value = os.getenv(name)
+    return value == 'True' if value else default
+
+
+bind = os.getenv('GUNICORN_BIND', '0.0.0.0:8000')
+
+# Workers x threads bounds how many requests run at once per container.
+workers = env_int('WEB_CONCURRENCY', multiprocessing.cpu_count() * 2 + 1)
+threads = env_int('GUNICORN_THREADS', 2)
+worker_class = 'gthread' if threads > 1 else 'sync'
+
+# Import Django once in the master and fork already-initialised workers, so
+# scale-ups pay the import cost once and workers share those pages.
+preload_app = env_bool('GUNICORN_PRELOAD', True)
+
+# Recycle workers to cap slow memory growth; the jitter keeps them from all
+# restarting at the same moment.
+max_requests = env_int('GUNICORN_MAX_REQUESTS', 1000)
+max_requests_jitter = env_int('GUNICORN_MAX_REQUESTS_JITTER', 100)
+
+timeout = env_int('GUNICORN_TIMEOUT', 30)
+graceful_timeout = env_int('GUNICORN_GRACEFUL_TIMEOUT', 30)
+keepalive = env_int('GUNICORN_KEEPALIVE', 5)
+
+# Heartbeat files on tmpfs so a slow disk can't get workers killed.
+if os.path.isdir('/dev/shm'):
+    worker_tmp_dir = '/dev/shm'
+
+pidfile = os.getenv('GUNICORN_PIDFILE') or None
+accesslog = os.getenv('GUNICORN_ACCESSLOG', '-')
+errorlog = '-'
+loglevel = os.getenv('GUNICORN_LOGLEVEL', 'info')
+
+
+def when_ready(server):
+    """Finish warming the preloaded app in the master before any fork"""
+    if not preload_app:
+        return
+    from django.urls import get_resolver
+
+    # Import urls, views, serializers and filters now instead of on each
+    # worker's first request.
+    get_resolver().url_patterns
+    # Move everything loaded so far out of the GC's reach so collections in
+    # the workers don't touch (and copy) the shared pages.
+    gc.freeze()
+
+
+def post_fork(server, worker):
+    """Never share the master's database connections with a worker"""
+    from django.db import connections
+
+    for connection in connections.all(initialized_only=True):
+        connection.close()
@@ -1,24 +1,33 @@
 # admin.py
+from django import forms
 from django.contrib import admin
-from .models import *
+from django.db.models import Count
+from django.utils.html import format_html
+from .images import queue_image
+from .models import (
+    Brand, Notebook, NotebookType, NotebookVariant, PendingImageUpload, Ruling, Size, VariantPriceTier,
+)
 
 @admin.register(Brand)
 class BrandAdmin(admin.ModelAdmin):
     model = Brand
     list_display = ['name','display_order','is_active']
     readonly_fields = ['slug']
+    query_budget = {'changelist': 5, 'add': 3, 'change': 3}
 
 @admin.register(NotebookType)
 class NotebookTypeAdmin(admin.ModelAdmin):
     model = NotebookType
     list_display = ['name','display_order']
     readonly_fields = ['slug']
+    query_budget = {'changelist': 5, 'add': 3, 'change': 3}
 
 @admin.register(Size)
 class SizeAdmin(admin.ModelAdmin):
     model = Size
     list_display = ['name', 'dimensions', 'slug', 'display_order']
     readonly_fields = ['slug']
+    query_budget = {'changelist': 5, 'add': 3, 'change': 3}
 
     def dimensions(self, obj):
         return obj.dimensions
@@ -30,6 +39,7 @@ class RulingAdmin(admin.ModelAdmin):
     model = Ruling
     list_display = ['name']
     readonly_fields = ['slug']
+    query_budget = {'changelist': 5, 'add': 3, 'change': 3}
 
 class NotebookVariantInline(admin.TabularInline):
     model = NotebookVariant
@@ -40,16 +50,54 @@ class NotebookVariantInline(admin.TabularInline):
     ]
     show_change_link = True
 
+    def get_queryset(self, request):
+        # Each row prints the variant, which reads its notebook, size and ruling.
+        return super().get_queryset(request).select_related('notebook', 'size', 'ruling')
+
+    def formfield_for_foreignkey(self, db_field, request, **kwargs):
+        field = super().formfield_for_foreignkey(db_field, request, **kwargs)
+        if db_field.name in ('size', 'ruling'):
+            # Load the choices once for the formset instead of once per row.
+            field.choices = list(field.choices)
+        return field
+
+
+
+class VariantPriceTierInline(admin.TabularInline):
+    model = VariantPriceTier
+    extra = 1
+    fields = ['min_quantity', 'price_per_unit', 'label']
+
+
+class NotebookAdminForm(forms.ModelForm):
+    # Replaces the CloudinaryField widget, which uploads inside the request.
+    upload = forms.ImageField(
+        required=False,
+        label='Upload image',
+        help_text='Uploaded to Cloudinary in the background, the notebook keeps its current image until then',
+    )
+
+    class Meta:
+        model = Notebook
+        exclude = ['image']
+
+    def clean(self):
+        cleaned_data = super().clean()
+        if self.instance.pk is None and not cleaned_data.get('upload'):
+            self.add_error('upload', 'An image is required for a new notebook')
+        return cleaned_data
 
 
 @admin.register(Notebook)
 class NotebookAdmin(admin.ModelAdmin):
+    form = NotebookAdminForm
     list_display = ['name', 'brand', 'notebook_type', 'variant_count', 'is_active']
     list_filter = ['brand', 'notebook_type', 'is_active']
     search_fields = ['name', 'brand__name', 'slug']
-    readonly_fields = ['slug', 'created_at', 'updated_at']
+    readonly_fields = ['slug', 'created_at', 'updated_at', 'image_status']
     list_editable = ['is_active']
     inlines = [NotebookVariantInline]
+    query_budget = {'changelist': 7, 'add': 9, 'change': 12}
     
     fieldsets = (
         ('Basic Information', {
@@ -60,7 +108,7 @@ class NotebookAdmin(admin.ModelAdmin):
             'description': 'General description that applies to all variants of this notebook'
         }),
         ('Image',{
-            'fields':('image',),
+            'fields':('image_status', 'upload'),
             'description': 'General image for notebook'
         }),
         ('Status', {
@@ -72,9 +120,27 @@ class NotebookAdmin(admin.ModelAdmin):
         }),
     )
     
+    def get_queryset(self, request):
+        return super().get_queryset(request).annotate(variant_total=Count('variants'))
+
     def variant_count(self, obj):
-        return obj.variants.count()
+        return obj.variant_total
     variant_count.short_description = 'Variants'
+    variant_count.admin_order_field = 'variant_total'
+
+    def image_status(self, obj):
+        pending = obj.pk is not None and obj.image_uploads.filter(status=PendingImageUpload.PENDING).exists()
+        note = ' (new image waiting for upload)' if pending else ''
+        if not obj.image:
+            return f'No image yet{note}'
+        return format_html('<img src="{}" style="max-height: 120px"><br>{}{}', obj.image.build_url(), obj.image.public_id, note)
+    image_status.short_description = 'Current image'
+
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        upload = form.cleaned_data.get('upload')
+        if upload and queue_image(obj, upload) is not None:
+            self.message_user(request, 'The image will be uploaded in the background.')
 
 
 @admin.register(NotebookVariant)
@@ -90,6 +156,9 @@ class NotebookVariantAdmin(admin.ModelAdmin):
     search_fields = ['notebook__name', 'notebook__brand__name', 'slug']
     readonly_fields = ['slug', 'created_at', 'updated_at', 'display_name', 'full_description']
     list_editable = ['is_active']
+    list_select_related = ['notebook', 'notebook__brand', 'size', 'ruling']
+    inlines = [VariantPriceTierInline]
+    query_budget = {'changelist': 9, 'add': 6, 'change': 7}
     
     fieldsets = (
         ('Notebook', {  
@@ -100,7 +169,7 @@ class NotebookVariantAdmin(admin.ModelAdmin):
         }),
         ('Pricing', {
             'fields': ('price_per_unit',),
-            'description': 'Price per unit'
+            'description': 'Price per unit. Quantity price breaks (dozen, carton) are set under Price Tiers below.'
         }),
         ('Description', {
             'fields': ('variant_description', 'full_description'),
@@ -115,6 +184,15 @@ class NotebookVariantAdmin(admin.ModelAdmin):
         }),
     )
     
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('notebook', 'notebook__brand', 'size', 'ruling')
+
+    def formfield_for_foreignkey(self, db_field, request, **kwargs):
+        if db_field.name == 'notebook':
+            # Notebook labels include the brand name.
+            kwargs['queryset'] = Notebook.objects.select_related('brand')
+        return super().formfield_for_foreignkey(db_field, request, **kwargs)
+
     def display_name(self, obj):
         return obj.display_name
     display_name.short_description = 'Full Name'
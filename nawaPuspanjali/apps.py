@@ -3,3 +3,6 @@ from django.apps import AppConfig
 
 class NawapuspanjaliConfig(AppConfig):
     name = 'nawaPuspanjali'
+
+    def ready(self):
+        from . import signals  # noqa: F401
@@ -0,0 +1,140 @@
+# changes.py
+"""
+Catalog change feed.
+
+Every save or delete of a catalog row appends a CatalogChange in the same
+transaction. Mirrors poll `/api/changes/?since=<cursor>` and receive only the
+rows touched after their cursor: current data for created/updated rows and
+tombstones for deleted ones, so a sync costs O(changes) rather than
+O(catalog). Rows that are no longer public (inactive brands, notebooks and
+variants) are sent as tombstones as well.
+
+The cursor is a sequence number, so it is only safe if sequence numbers
+become visible in order. On PostgreSQL writers of the log hold an advisory
+lock from their first change until their transaction ends, so a lower seq
+can never commit after a higher one is visible; SQLite serialises writers
+on its own.
+"""
+from django.conf import settings
+from django.db import connections, router, transaction
+from rest_framework.exceptions import ValidationError
+from .models import Brand, CatalogChange, Notebook, NotebookType, NotebookVariant, Ruling, Size
+from .serializers import (
+    BrandChangeSerializer, NotebookChangeSerializer, NotebookTypeChangeSerializer,
+    NotebookVariantChangeSerializer, RulingChangeSerializer, SizeChangeSerializer,
+)
+
+CHANGE_FEED_PAGE_SIZE = getattr(settings, 'CHANGE_FEED_PAGE_SIZE', 500)
+CHANGE_FEED_MAX_PAGE_SIZE = getattr(settings, 'CHANGE_FEED_MAX_PAGE_SIZE', 5000)
+# Key of the PostgreSQL advisory lock that orders writers of the log.
+CHANGE_FEED_LOCK_KEY = getattr(settings, 'CHANGE_FEED_LOCK_KEY', 7310001)
+
+# Feed name -> (model, queryset for current public rows, serializer)
+CHANGE_MODELS = {
+    'brand': (Brand, lambda: Brand.objects.active(), BrandChangeSerializer),
+    'notebook_type': (NotebookType, lambda: NotebookType.objects.all(), NotebookTypeChangeSerializer),
+    'size': (Size, lambda: Size.objects.all(), SizeChangeSerializer),
+    'ruling': (Ruling, lambda: Ruling.objects.all(), RulingChangeSerializer),
+    'notebook': (Notebook, lambda: Notebook.objects.active(), NotebookChangeSerializer),
+    'notebook_variant': (
+        NotebookVariant,
+        lambda: NotebookVariant.objects.active().prefetch_related('price_tiers'),
+        NotebookVariantChangeSerializer,
+    ),
+}
+MODEL_NAMES = {model: name for name, (model, _, _) in CHANGE_MODELS.items()}
+
+
+def lock_change_log(using):
+    """Hold the log's write lock until the current transaction ends (PostgreSQL only)"""
+    connection = connections[using]
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT pg_advisory_xact_lock(%s)', [CHANGE_FEED_LOCK_KEY])
+
+
+def record_change(instance, action):
+    """Append a change for a catalog row, called from the model signals"""
+    name = MODEL_NAMES.get(type(instance))
+    if name is None or instance.pk is None:
+        return None
+    using = router.db_for_write(CatalogChange)
+    # Outside a transaction the lock would be released before the insert.
+    with transaction.atomic(using=using, savepoint=False):
+        lock_change_log(using)
+        return CatalogChange.objects.using(using).create(
+            model=name,
+            object_id=instance.pk,
+            slug=getattr(instance, 'slug', '') or '',
+            action=action,
+        )
+
+
+def parse_cursor(value):
+    if value in (None, ''):
+        return 0
+    try:
+        cursor = int(value)
+    except (TypeError, ValueError):
+        cursor = -1
+    if cursor < 0:
+        raise ValidationError({'since': ['Cursor must be a non-negative integer returned as next_cursor.']})
+    return cursor
+
+
+def parse_limit(value):
+    if value in (None, ''):
+        return CHANGE_FEED_PAGE_SIZE
+    try:
+        limit = int(value)
+    except (TypeError, ValueError):
+        limit = 0
+    if not 0 < limit <= CHANGE_FEED_MAX_PAGE_SIZE:
+        raise ValidationError({'limit': [f'Limit must be between 1 and {CHANGE_FEED_MAX_PAGE_SIZE}.']})
+    return limit
+
+
+def build_change_feed(since, limit=CHANGE_FEED_PAGE_SIZE, context=None):
+    """
+    Collapse the next `limit` log entries after `since` to the latest action
+    per row and attach the current data of upserted rows, one query per model.
+    """
+    entries = list(CatalogChange.objects.filter(seq__gt=since).order_by('seq')[:limit])
+
+    latest = {}
+    for entry in entries:
+        latest[(entry.model, entry.object_id)] = entry
+
+    upserted = {}
+    for (name, object_id), entry in latest.items():
+        if entry.action == CatalogChange.UPSERT and name in CHANGE_MODELS:
+            upserted.setdefault(name, []).append(object_id)
+
+    current = {}
+    for name, ids in upserted.items():
+        _, queryset, serializer_class = CHANGE_MODELS[name]
+        rows = queryset().filter(pk__in=ids).order_by()
+        current[name] = {row['id']: row for row in serializer_class(rows, many=True, context=context).data}
+
+    changes = []
+    for entry in sorted(latest.values(), key=lambda entry: entry.seq):
+        change = {
+            'seq': entry.seq,
+            'model': entry.model,
+            'id': entry.object_id,
+            'action': entry.action,
+        }
+        data = current.get(entry.model, {}).get(entry.object_id) if entry.action == CatalogChange.UPSERT else None
+        if data is None:
+            # Deleted, or no longer public.
+            change['action'] = CatalogChange.DELETE
+            change['slug'] = entry.slug
+        else:
+            change['data'] = data
+        changes.append(change)
+
+    return {
+        'changes': changes,
+        'next_cursor': entries[-1].seq if entries else since,
+        'has_more': len(entries) == limit,
+    }
@@ -0,0 +1,189 @@
+# db_router.py
+"""
+Read-replica routing for catalog reads.
+
+Only code wrapped in `replica_reads` (the public catalog viewsets and
+filter_options) is ever sent to a replica; everything else, including the
+admin, stays on `default`. A client that wrote recently carries a short-lived
+cookie that pins its reads to the primary so it always sees its own writes.
+"""
+import contextvars
+import functools
+import itertools
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+
+REPLICA_ALIAS_PREFIX = 'replica_'
+PIN_COOKIE = 'pin_primary'
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+logger = logging.getLogger(__name__)
+
+# Seconds a PostgreSQL replica is behind. The time since the last replayed
+# transaction keeps growing while the primary is idle, so it only counts
+# when the replica has received WAL it hasn't replayed yet.
+LAG_QUERY = (
+    'SELECT CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 '
+    'ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0) END'
+)
+
+_use_replica = contextvars.ContextVar('use_replica', default=False)
+# Alias picked for the current reading_from_replica block.
+_replica = contextvars.ContextVar('replica_alias', default=None)
+_pinned = contextvars.ContextVar('pinned_to_primary', default=False)
+_wrote = contextvars.ContextVar('wrote_to_primary', default=False)
+
+
+def replica_aliases():
+    return [alias for alias in settings.DATABASES if alias.startswith(REPLICA_ALIAS_PREFIX)]
+
+
+@contextmanager
+def reading_from_replica(enabled=True):
+    """
+    Allow reads inside the block to be served by a replica. All of them go
+    to the same one, so a response doesn't mix rows from replicas at
+    different points of replication.
+    """
+    token = _use_replica.set(enabled)
+    replica_token = _replica.set(None)
+    try:
+        yield
+    finally:
+        _replica.reset(replica_token)
+        _use_replica.reset(token)
+
+
+@contextmanager
+def pinned_to_primary(pinned=True):
+    """Keep reads inside the block on the primary, yields a callable telling whether the block wrote"""
+    pinned_token = _pinned.set(pinned)
+    wrote_token = _wrote.set(False)
+    try:
+        yield _wrote.get
+    finally:
+        _wrote.reset(wrote_token)
+        _pinned.reset(pinned_token)
+
+
+def replica_reads(view):
+    """Let a function view's safe requests read from replicas"""
+    @functools.wraps(view)
+    def wrapped(request, *args, **kwargs):
+        with reading_from_replica(request.method in SAFE_METHODS):
+            return view(request, *args, **kwargs)
+    return wrapped
+
+
+class ReplicaReadMixin:
+    """Let a class based view's safe requests read from replicas"""
+
+    def dispatch(self, request, *args, **kwargs):
+        with reading_from_replica(request.method in SAFE_METHODS):
+            return super().dispatch(request, *args, **kwargs)
+
+
+class ReplicaRouter:
+    """
+    Round-robin over healthy `replica_*` aliases for reads flagged with
+    `replica_reads`, one alias per request, `default` for everything else.
+    """
+
+    def __init__(self, replicas=None, health_check=None):
+        self.replicas = list(replicas) if replicas is not None else replica_aliases()
+        self.check_interval = getattr(settings, 'REPLICA_HEALTH_CHECK_INTERVAL', 5)
+        self.max_lag = getattr(settings, 'REPLICA_MAX_LAG_SECONDS', 30)
+        self._health_check = health_check or self.check_replica
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """Forget replica health and restart the round-robin, for tests"""
+        with self._lock:
+            self._cycle = itertools.cycle(self.replicas)
+            self._health = {}
+
+    def db_for_read(self, model, **hints):
+        if not self.replicas or not _use_replica.get() or _pinned.get() or _wrote.get():
+            return None
+        alias = _replica.get()
+        if alias is None:
+            alias = self.pick_replica()
+            _replica.set(alias)
+        return alias
+
+    def pick_replica(self):
+        """Next healthy replica in the round-robin, `default` when none is"""
+        for _ in range(len(self.replicas)):
+            with self._lock:
+                alias = next(self._cycle)
+            if self.is_healthy(alias):
+                return alias
+        return DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        # Anything read after a write in the same request must see it.
+        _wrote.set(True)
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return not db.startswith(REPLICA_ALIAS_PREFIX)
+
+    def is_healthy(self, alias):
+        now = time.monotonic()
+        healthy, checked_at = self._health.get(alias, (True, None))
+        if checked_at is None or now - checked_at >= self.check_interval:
+            healthy = self._health_check(alias)
+            self._health[alias] = (healthy, now)
+        return healthy
+
+    def check_replica(self, alias):
+        """A replica is healthy when it answers and, on PostgreSQL, is not lagging too far behind"""
+        connection = connections[alias]
+        try:
+            with connection.cursor() as cursor:
+                if connection.vendor == 'postgresql':
+                    cursor.execute(LAG_QUERY)
+                    return float(cursor.fetchone()[0]) <= self.max_lag
+                cursor.execute('SELECT 1')
+                return True
+        except DatabaseError:
+            logger.warning('Replica %s failed its health check', alias, exc_info=True)
+            connection.close()
+            return False
+
+
+class PrimaryPinningMiddleware:
+    """
+    After a request that wrote to the database, pin the client's reads to
+    the primary for REPLICA_PIN_SECONDS so replication lag can't hide its
+    own changes.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.pin_seconds = getattr(settings, 'REPLICA_PIN_SECONDS', 10)
+
+    def __call__(self, request):
+        with pinned_to_primary(self.is_pinned(request)) as wrote:
+            response = self.get_response(request)
+            pin = wrote()
+        if pin and self.pin_seconds:
+            response.set_cookie(
+                PIN_COOKIE, str(time.time() + self.pin_seconds),
+                max_age=self.pin_seconds, httponly=True, samesite='Lax',
+            )
+        return response
+
+    def is_pinned(self, request):
+        try:
+            return float(request.COOKIES.get(PIN_COOKIE, 0)) > time.time()
+        except ValueError:
+            return False
@@ -1,27 +1,126 @@
 # filters.py
+import re
+from django import forms
+from django.db.models import Exists, F, OuterRef, Subquery
 from django_filters import rest_framework as filters
-from .models import NotebookVariant, Notebook
+from .models import NotebookVariant, Notebook, Size
 
-class NotebookVariantFilter(filters.FilterSet):
+# Range filters on the size, in millimetres, mapped to Size lookups.
+DIMENSION_LOOKUPS = {
+    'min_width': 'width_mm__gte',
+    'max_width': 'width_mm__lte',
+    'min_height': 'height_mm__gte',
+    'max_height': 'height_mm__lte',
+    'min_area': 'area_mm2__gte',
+    'max_area': 'area_mm2__lte',
+}
+
+_DIMENSIONS = re.compile(r'^\s*(\d+(?:\.\d+)?)\s*[x×]\s*(\d+(?:\.\d+)?)\s*$', re.IGNORECASE)
+
+
+class DimensionsField(forms.CharField):
+    """Parse "WxH" in millimetres into a (width, height) tuple"""
+
+    def to_python(self, value):
+        value = super().to_python(value)
+        if not value:
+            return None
+        match = _DIMENSIONS.match(value)
+        if match is None:
+            raise forms.ValidationError('Enter dimensions in millimetres as WIDTHxHEIGHT, e.g. 210x297.')
+        return float(match.group(1)), float(match.group(2))
+
+
+class DimensionsFilter(filters.Filter):
+    field_class = DimensionsField
+
+
+def size_distance(prefix, width, height):
+    """Squared distance in mm between the size reached through `prefix` and width x height"""
+    dw = F(f'{prefix}width_mm') - width
+    dh = F(f'{prefix}height_mm') - height
+    return dw * dw + dh * dh
+
+
+class SizeDimensionFilterSet(filters.FilterSet):
+    """
+    Width, height and area ranges plus `closest_to=WxH`, all in millimetres.
+    The constraints are combined so they apply to the same size, and
+    `closest_to` keeps only the nearest size(s) left by the other filters;
+    both are resolved in SQL through the indexed *_mm columns on Size.
+    """
+    min_width = filters.NumberFilter(method='filter_dimensions')
+    max_width = filters.NumberFilter(method='filter_dimensions')
+    min_height = filters.NumberFilter(method='filter_dimensions')
+    max_height = filters.NumberFilter(method='filter_dimensions')
+    min_area = filters.NumberFilter(method='filter_dimensions')
+    max_area = filters.NumberFilter(method='filter_dimensions')
+    closest_to = DimensionsFilter(method='filter_dimensions')
+
+    def filter_dimensions(self, queryset, name, value):
+        # Applied together in filter_queryset.
+        return queryset
+
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        data = self.form.cleaned_data
+        lookups = {lookup: data[name] for name, lookup in DIMENSION_LOOKUPS.items() if data.get(name) is not None}
+        sizes = Size.objects.filter(**lookups).values('pk') if lookups else None
+        if sizes is not None:
+            queryset = self.filter_sizes(queryset, sizes)
+        if data.get('closest_to'):
+            queryset = self.filter_closest(queryset, sizes, *data['closest_to'])
+        return queryset
+
+    def filter_sizes(self, queryset, sizes):
+        """Rows whose own size is one of `sizes`, subclasses reaching the size another way override this"""
+        return queryset.filter(size__in=sizes)
+
+    def filter_closest(self, queryset, sizes, width, height):
+        # `queryset` is already limited to `sizes`.
+        distance = size_distance('size__', width, height)
+        nearest = queryset.annotate(size_distance=distance).order_by('size_distance').values('size_distance')[:1]
+        return queryset.annotate(size_distance=distance).filter(size_distance=Subquery(nearest))
+
+
+class NotebookVariantFilter(SizeDimensionFilterSet):
     """Filter for variants"""
     brand = filters.NumberFilter(field_name='notebook__brand__id')
     notebook_type = filters.NumberFilter(field_name='notebook__notebook_type__id')
     size = filters.NumberFilter(field_name='size__id')
     ruling = filters.NumberFilter(field_name='ruling__id')
-    min_price = filters.NumberFilter(field_name='price_per_dozen', lookup_expr='gte')
-    max_price = filters.NumberFilter(field_name='price_per_dozen', lookup_expr='lte')
-    min_pages = filters.NumberFilter(field_name='no_of_pages', lookup_expr='gte')
-    
+    min_price = filters.NumberFilter(field_name='price_per_unit', lookup_expr='gte')
+    max_price = filters.NumberFilter(field_name='price_per_unit', lookup_expr='lte')
+    min_gsm = filters.NumberFilter(field_name='gsm', lookup_expr='gte')
+
     class Meta:
         model = NotebookVariant
         fields = ['size', 'ruling', 'is_active']
 
-class NotebookFilter(filters.FilterSet):
+
+class NotebookFilter(SizeDimensionFilterSet):
     brand = filters.NumberFilter(field_name='brand__id')
     notebook_type = filters.NumberFilter(field_name='notebook_type__id')
     # size = filters.NumberFilter(field_name='size__id')
     # ruling = filters.NumberFilter(field_name='ruling__id')
-    
+
     class Meta:
         model  = Notebook
-        fields = ['brand', 'notebook_type']
\ No newline at end of file
+        fields = ['brand', 'notebook_type']
+
+    def filter_sizes(self, queryset, sizes):
+        # Notebooks with an active variant in one of the sizes, without joining
+        # (and duplicating rows) through the variants.
+        return queryset.filter(Exists(
+            NotebookVariant.objects.active().filter(notebook=OuterRef('pk'), size__in=sizes)
+        ))
+
+    def filter_closest(self, queryset, sizes, width, height):
+        variants = NotebookVariant.objects.active().filter(notebook__in=queryset.values('pk'))
+        if sizes is not None:
+            variants = variants.filter(size__in=sizes)
+        variants = variants.annotate(size_distance=size_distance('size__', width, height))
+        nearest = variants.order_by('size_distance').values('size_distance')[:1]
+        return queryset.filter(Exists(
+            variants.filter(notebook=OuterRef('pk'), size_distance=Subquery(nearest))
+        ))
@@ -0,0 +1,160 @@
+# images.py
+"""
+Background image uploads for notebooks.
+
+Saving a notebook in the admin no longer uploads to Cloudinary inside the
+request. `queue_image` hashes the file and either points the notebook at an
+ImageAsset with the same bytes right away, or keeps the file on local
+storage (MEDIA_ROOT, which the web and worker processes must share) as a
+PendingImageUpload. `process_image_uploads` drains those in batches: each
+distinct file is uploaded once, with the field's transformation and the
+eager variants in IMAGE_EAGER_TRANSFORMATIONS, then the public id is
+swapped into every notebook waiting on it. A batch is leased for
+IMAGE_UPLOAD_LEASE_SECONDS in a short transaction and uploaded with no
+locks held, so rows of a worker that dies mid-upload are picked up again
+once the lease runs out; the content-addressed public id makes that retry
+reuse the copy already on Cloudinary.
+"""
+import hashlib
+import logging
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Exists, OuterRef
+from django.utils import timezone
+from django.utils.module_loading import import_string
+from . import queues
+from .models import ImageAsset, Notebook, PendingImageUpload
+
+logger = logging.getLogger(__name__)
+
+IMAGE_UPLOAD_BATCH_SIZE = getattr(settings, 'IMAGE_UPLOAD_BATCH_SIZE', 20)
+IMAGE_UPLOAD_MAX_ATTEMPTS = getattr(settings, 'IMAGE_UPLOAD_MAX_ATTEMPTS', 5)
+# How long a claimed batch is hidden from other workers, must outlast its uploads.
+IMAGE_UPLOAD_LEASE_SECONDS = getattr(settings, 'IMAGE_UPLOAD_LEASE_SECONDS', 300)
+
+# Derived images generated at upload time so the first storefront request
+# doesn't wait for Cloudinary to build them.
+IMAGE_EAGER_TRANSFORMATIONS = getattr(settings, 'IMAGE_EAGER_TRANSFORMATIONS', [
+    {'width': 400, 'crop': 'limit', 'quality': 'auto', 'fetch_format': 'auto'},
+    {'width': 1200, 'crop': 'limit', 'quality': 'auto', 'fetch_format': 'auto'},
+])
+
+
+def content_hash(fileobj):
+    """SHA-256 of an uploaded or stored file, read in chunks"""
+    digest = hashlib.sha256()
+    for chunk in fileobj.chunks():
+        digest.update(chunk)
+    fileobj.seek(0)
+    return digest.hexdigest()
+
+
+def assign_image(notebook, resource):
+    """Point a notebook at an uploaded image; saved through the model so the change feed and outbox see it"""
+    notebook.image = Notebook._meta.get_field('image').to_python(resource)
+    notebook.save(update_fields=['image', 'updated_at'])
+
+
+def queue_image(notebook, upload):
+    """
+    Attach `upload` to a saved notebook without uploading it.
+    Returns the PendingImageUpload, or None when the same bytes were already
+    uploaded and the notebook now uses them.
+    """
+    digest = content_hash(upload)
+    asset = ImageAsset.objects.filter(content_hash=digest).first()
+    if asset is not None:
+        assign_image(notebook, asset.resource)
+        return None
+    return PendingImageUpload.objects.create(notebook=notebook, file=upload, content_hash=digest)
+
+
+def claim_batch(batch_size=IMAGE_UPLOAD_BATCH_SIZE):
+    """Lease the next pending rows to this worker, see queues.claim_batch"""
+    pending = PendingImageUpload.objects.select_related('notebook').filter(status=PendingImageUpload.PENDING)
+    return queues.claim_batch(pending, batch_size, IMAGE_UPLOAD_LEASE_SECONDS)
+
+
+def process_batch(uploader, batch_size=IMAGE_UPLOAD_BATCH_SIZE):
+    """
+    Upload one batch of pending files, returns (rows, uploads). Files are
+    grouped by content hash and uploaded once per hash with no transaction
+    open; each hash is then swapped into its notebooks in a short
+    transaction of its own. A failing hash is retried on the next batch up
+    to IMAGE_UPLOAD_MAX_ATTEMPTS.
+    """
+    options = dict(Notebook._meta.get_field('image').options, eager=IMAGE_EAGER_TRANSFORMATIONS)
+    uploads = 0
+    rows = claim_batch(batch_size)
+    groups = {}
+    for row in rows:
+        groups.setdefault(row.content_hash, []).append(row)
+
+    # Only the newest upload of a notebook is swapped in, including across
+    # batches and workers: a retried older upload mustn't replace a newer one
+    # that went through, or is still on its way.
+    newer_uploads = PendingImageUpload.objects.filter(
+        notebook=OuterRef('notebook'), pk__gt=OuterRef('pk'),
+        status__in=[PendingImageUpload.PENDING, PendingImageUpload.DONE],
+    )
+    for digest, group in groups.items():
+        try:
+            asset = ImageAsset.objects.filter(content_hash=digest).first()
+            if asset is None:
+                with group[0].file.open('rb') as fh:
+                    resource = uploader.upload(fh, public_id=digest, **options)
+                uploads += 1
+                asset, _ = ImageAsset.objects.get_or_create(content_hash=digest, defaults={'resource': resource})
+            with transaction.atomic():
+                superseded = set(
+                    PendingImageUpload.objects.filter(pk__in=[row.pk for row in group])
+                    .filter(Exists(newer_uploads)).values_list('pk', flat=True)
+                )
+                for row in group:
+                    if row.pk not in superseded:
+                        assign_image(row.notebook, asset.resource)
+                    row.status = PendingImageUpload.DONE
+                    row.processed_at = timezone.now()
+                    row.leased_until = None
+                PendingImageUpload.objects.bulk_update(group, ['status', 'processed_at', 'leased_until'])
+                for row in group:
+                    transaction.on_commit(lambda file=row.file: file.delete(save=False))
+        except Exception as exc:
+            logger.exception('Image upload failed for %s', digest)
+            for row in group:
+                row.attempts += 1
+                row.last_error = repr(exc)[:1000]
+                row.leased_until = None
+                if row.attempts >= IMAGE_UPLOAD_MAX_ATTEMPTS:
+                    row.status = PendingImageUpload.FAILED
+            PendingImageUpload.objects.bulk_update(group, ['attempts', 'last_error', 'status', 'leased_until'])
+    return len(rows), uploads
+
+
+def get_uploader():
+    return import_string(getattr(settings, 'IMAGE_UPLOADER', 'nawaPuspanjali.images.CloudinaryUploader'))()
+
+
+class CloudinaryUploader:
+    """Upload with the cloudinary SDK, configured from CLOUDINARY_URL"""
+
+    def upload(self, fileobj, public_id, **options):
+        import cloudinary.uploader
+
+        # A content-addressed public id makes a re-run after a crash reuse
+        # the copy already on Cloudinary instead of uploading it again.
+        resource = cloudinary.uploader.upload_resource(
+            fileobj, public_id=public_id, overwrite=False, resource_type='image', **options
+        )
+        return resource.get_prep_value()
+
+
+class FakeUploader:
+    """Record uploads in `uploaded` and return a Cloudinary-shaped value, for tests"""
+
+    def __init__(self):
+        self.uploaded = []
+
+    def upload(self, fileobj, public_id, **options):
+        self.uploaded.append({'public_id': public_id, 'size': len(fileobj.read()), **options})
+        return f"image/upload/v1/{options.get('folder', 'fake')}/{public_id}.jpg"
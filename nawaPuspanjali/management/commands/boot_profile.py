@@ -0,0 +1,139 @@
+import json
+import os
+import subprocess
+import sys
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+# What a worker does before serving its first request: set Django up and
+# load the URLconf (views, serializers, filters).
+BOOT_SNIPPET = (
+    'import django; django.setup(); '
+    'from django.urls import get_resolver; get_resolver().url_patterns'
+)
+
+
+def profile_imports():
+    """Boot Django in a fresh interpreter under -X importtime, return (wall seconds, rows)"""
+    env = dict(os.environ, DJANGO_SETTINGS_MODULE=os.environ.get('DJANGO_SETTINGS_MODULE', settings.SETTINGS_MODULE))
+    started = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', BOOT_SNIPPET],
+        env=env, capture_output=True, text=True,
+    )
+    elapsed = time.perf_counter() - started
+    if result.returncode:
+        raise CommandError(f'Boot failed:\n{result.stderr[-2000:]}')
+    return elapsed, parse_importtime(result.stderr)
+
+
+def parse_importtime(output):
+    """One row per module from the -X importtime report, depth 0 for top-level imports"""
+    rows = []
+    for line in output.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        depth = (len(name) - len(name.lstrip())) // 2
+        rows.append({
+            'module': name.strip(),
+            'self_ms': int(self_us) / 1000,
+            'cumulative_ms': int(cumulative_us) / 1000,
+            'depth': depth,
+        })
+    return rows
+
+
+def read_memory(pid):
+    """Resident and proportional set size of a process in MiB, from /proc"""
+    values = {}
+    try:
+        with open(f'/proc/{pid}/smaps_rollup') as fh:
+            for line in fh:
+                key, _, rest = line.partition(':')
+                if key in ('Rss', 'Pss', 'Private_Clean', 'Private_Dirty'):
+                    values[key] = int(rest.split()[0]) / 1024
+    except FileNotFoundError:
+        with open(f'/proc/{pid}/status') as fh:
+            for line in fh:
+                if line.startswith('VmRSS:'):
+                    values['Rss'] = int(line.split()[1]) / 1024
+    return {
+        'pid': pid,
+        'rss_mb': round(values.get('Rss', 0), 1),
+        'pss_mb': round(values.get('Pss', 0), 1) if 'Pss' in values else None,
+        'private_mb': round(values.get('Private_Clean', 0) + values.get('Private_Dirty', 0), 1) if 'Pss' in values else None,
+    }
+
+
+def child_pids(pid):
+    children = []
+    for entry in os.listdir('/proc'):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f'/proc/{entry}/stat') as fh:
+                # The command name may contain spaces, the ppid follows the closing paren.
+                ppid = int(fh.read().rsplit(')', 1)[1].split()[1])
+        except (FileNotFoundError, IndexError, ValueError):
+            continue
+        if ppid == pid:
+            children.append(int(entry))
+    return sorted(children)
+
+
+class Command(BaseCommand):
+    help = 'Report boot import time and, for a running gunicorn, memory per worker'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--top', type=int, default=20, help='Number of slowest imports to list')
+        parser.add_argument('--pid', type=int, help='PID of the gunicorn master')
+        parser.add_argument(
+            '--pidfile', default=os.getenv('GUNICORN_PIDFILE'),
+            help='Read the gunicorn master PID from this file (defaults to $GUNICORN_PIDFILE)',
+        )
+        parser.add_argument('--json', action='store_true', help='Emit a single JSON document for tracking')
+
+    def handle(self, *args, **options):
+        elapsed, rows = profile_imports()
+        report = {
+            'boot_seconds': round(elapsed, 3),
+            'import_ms': round(sum(row['self_ms'] for row in rows), 1),
+            'modules': len(rows),
+            'slowest_top_level': sorted(
+                (row for row in rows if row['depth'] == 0), key=lambda row: -row['cumulative_ms']
+            )[:options['top']],
+        }
+
+        pid = options['pid']
+        if pid is None and options['pidfile']:
+            try:
+                with open(options['pidfile']) as fh:
+                    pid = int(fh.read().strip())
+            except FileNotFoundError:
+                pid = None
+        if pid is not None:
+            if not os.path.exists(f'/proc/{pid}'):
+                raise CommandError(f'No process with PID {pid}')
+            report['master'] = read_memory(pid)
+            report['workers'] = [read_memory(child) for child in child_pids(pid)]
+
+        if options['json']:
+            self.stdout.write(json.dumps(report, indent=2))
+            return
+
+        self.stdout.write(
+            f"Boot: {report['boot_seconds']:.3f}s wall, {report['import_ms']:.1f}ms in imports "
+            f"across {report['modules']} modules"
+        )
+        self.stdout.write('Slowest top-level imports (cumulative ms):')
+        for row in report['slowest_top_level']:
+            self.stdout.write(f"  {row['cumulative_ms']:9.1f}  {row['module']}")
+        if 'master' in report:
+            self.stdout.write('Memory (MiB):')
+            for label, usage in [('master', report['master'])] + [('worker', w) for w in report['workers']]:
+                self.stdout.write(
+                    f"  {label:<7} pid={usage['pid']:<8} rss={usage['rss_mb']:<8} "
+                    f"pss={usage['pss_mb']}  private={usage['private_mb']}"
+                )
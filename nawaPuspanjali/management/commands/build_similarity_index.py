@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+from nawaPuspanjali.models import Notebook
+from nawaPuspanjali.similarity import SIMILARITY_TOP_K, build_similarity_index, refresh_similarity
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the precomputed "similar notebooks" index'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--top-k', type=int, default=SIMILARITY_TOP_K, help='Neighbours stored per notebook')
+        parser.add_argument(
+            '--notebook', action='append', default=[], metavar='SLUG',
+            help='Only refresh the given notebook(s) and the rows they affect; repeatable',
+        )
+
+    def handle(self, *args, **options):
+        if options['notebook']:
+            ids = Notebook.objects.filter(slug__in=options['notebook']).values_list('pk', flat=True)
+            written = refresh_similarity(ids, k=options['top_k'])
+        else:
+            written = build_similarity_index(k=options['top_k'])
+        self.stdout.write(self.style.SUCCESS(f'Stored {written} neighbour rows'))
@@ -0,0 +1,43 @@
+import time
+from datetime import timedelta
+from django.core.management.base import CommandError
+from django.utils import timezone
+from nawaPuspanjali.models import OutboxEvent
+from nawaPuspanjali.outbox import OUTBOX_BATCH_SIZE, dispatch_batch, get_sinks
+from nawaPuspanjali.queues import QueueCommand
+
+
+class Command(QueueCommand):
+    help = 'Deliver pending catalog outbox events to the sinks in settings.OUTBOX_SINKS'
+    batch_size = OUTBOX_BATCH_SIZE
+    interval = 2.0
+    summary = 'Dispatched {} outbox rows as {} events'
+
+    def add_arguments(self, parser):
+        super().add_arguments(parser)
+        parser.add_argument(
+            '--prune-days', type=int, default=7,
+            help='Delete dispatched events older than this many days (0 keeps them)',
+        )
+        parser.add_argument(
+            '--prune-interval', type=float, default=3600.0,
+            help='Seconds between prunes with --loop',
+        )
+
+    def handle(self, *args, **options):
+        self.sinks = get_sinks()
+        if not self.sinks:
+            raise CommandError('No OUTBOX_SINKS configured')
+        self.pruned_at = None
+        super().handle(*args, **options)
+
+    def process_batch(self, options):
+        return dispatch_batch(self.sinks, options['batch_size'])
+
+    def after_drain(self, options):
+        if options['prune_days'] and (
+            self.pruned_at is None or time.monotonic() - self.pruned_at >= options['prune_interval']
+        ):
+            cutoff = timezone.now() - timedelta(days=options['prune_days'])
+            OutboxEvent.objects.filter(dispatched_at__lt=cutoff).delete()
+            self.pruned_at = time.monotonic()
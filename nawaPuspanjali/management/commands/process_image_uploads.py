@@ -0,0 +1,16 @@
+from nawaPuspanjali.images import IMAGE_UPLOAD_BATCH_SIZE, get_uploader, process_batch
+from nawaPuspanjali.queues import QueueCommand
+
+
+class Command(QueueCommand):
+    help = 'Upload notebook images queued by the admin to Cloudinary and swap them in'
+    batch_size = IMAGE_UPLOAD_BATCH_SIZE
+    interval = 5.0
+    summary = 'Processed {} pending images with {} uploads'
+
+    def handle(self, *args, **options):
+        self.uploader = get_uploader()
+        super().handle(*args, **options)
+
+    def process_batch(self, options):
+        return process_batch(self.uploader, options['batch_size'])
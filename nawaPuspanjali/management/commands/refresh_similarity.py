@@ -0,0 +1,16 @@
+from nawaPuspanjali.queues import QueueCommand
+from nawaPuspanjali.similarity import SIMILARITY_REFRESH_BATCH_SIZE, SIMILARITY_TOP_K, refresh_pending
+
+
+class Command(QueueCommand):
+    help = 'Recompute the similar notebooks of the notebooks queued by catalog saves'
+    batch_size = SIMILARITY_REFRESH_BATCH_SIZE
+    interval = 10.0
+    summary = 'Refreshed {} notebooks, stored {} neighbour rows'
+
+    def add_arguments(self, parser):
+        super().add_arguments(parser)
+        parser.add_argument('--top-k', type=int, default=SIMILARITY_TOP_K, help='Neighbours stored per notebook')
+
+    def process_batch(self, options):
+        return refresh_pending(options['batch_size'], options['top_k'])
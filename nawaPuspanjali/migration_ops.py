@@ -0,0 +1,128 @@
+# migration_ops.py
+"""
+Migration operations that keep the catalog readable while they run.
+
+- AddIndexConcurrently / RemoveIndexConcurrently build and drop indexes
+  with CREATE/DROP INDEX CONCURRENTLY on PostgreSQL, so `migrate` never holds
+  a lock that blocks reads or writes on the table. They need a migration
+  with `atomic = False` and fall back to normal DDL on other databases.
+- backfill_in_batches fills new (denormalised) columns in pk-ordered
+  batches, each in its own transaction with a pause in between, instead of
+  one UPDATE that locks every row for its whole duration. Call it from a
+  RunPython function of a migration with `atomic = False`.
+
+Migrations are applied by predeploy.sh before the new release starts.
+"""
+import time
+from django.conf import settings
+from django.db import NotSupportedError, migrations, transaction
+
+BACKFILL_BATCH_SIZE = getattr(settings, 'BACKFILL_BATCH_SIZE', 1000)
+BACKFILL_PAUSE_SECONDS = getattr(settings, 'BACKFILL_PAUSE_SECONDS', 0.1)
+
+
+def ensure_not_in_transaction(schema_editor, operation):
+    if schema_editor.connection.in_atomic_block:
+        raise NotSupportedError(
+            f'{operation} can not run inside a transaction, set atomic = False on the migration.'
+        )
+
+
+def index_state(schema_editor, name):
+    """None when the index doesn't exist, else whether PostgreSQL considers it valid"""
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT i.indisvalid FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid '
+            'WHERE c.relname = %s AND pg_catalog.pg_table_is_visible(c.oid)',
+            [name],
+        )
+        row = cursor.fetchone()
+    return None if row is None else row[0]
+
+
+class AddIndexConcurrently(migrations.AddIndex):
+    """AddIndex that doesn't lock the table on PostgreSQL"""
+
+    def database_forwards(self, app_label, schema_editor, from_state, to_state):
+        model = to_state.apps.get_model(app_label, self.model_name)
+        if not self.allow_migrate_model(schema_editor.connection.alias, model):
+            return
+        if schema_editor.connection.vendor != 'postgresql':
+            schema_editor.add_index(model, self.index)
+            return
+        ensure_not_in_transaction(schema_editor, type(self).__name__)
+        # A failed or interrupted concurrent build leaves an invalid index
+        # behind; drop it so a rerun of the migration can start over.
+        state = index_state(schema_editor, self.index.name)
+        if state is False:
+            schema_editor.execute(f'DROP INDEX CONCURRENTLY IF EXISTS {schema_editor.quote_name(self.index.name)}')
+        elif state is True:
+            return
+        schema_editor.add_index(model, self.index, concurrently=True)
+
+    def database_backwards(self, app_label, schema_editor, from_state, to_state):
+        model = from_state.apps.get_model(app_label, self.model_name)
+        if not self.allow_migrate_model(schema_editor.connection.alias, model):
+            return
+        if schema_editor.connection.vendor != 'postgresql':
+            schema_editor.remove_index(model, self.index)
+            return
+        ensure_not_in_transaction(schema_editor, type(self).__name__)
+        schema_editor.remove_index(model, self.index, concurrently=True)
+
+    def describe(self):
+        return f'{super().describe()} concurrently'
+
+
+class RemoveIndexConcurrently(migrations.RemoveIndex):
+    """RemoveIndex that doesn't lock the table on PostgreSQL"""
+
+    def database_forwards(self, app_label, schema_editor, from_state, to_state):
+        model = from_state.apps.get_model(app_label, self.model_name)
+        if not self.allow_migrate_model(schema_editor.connection.alias, model):
+            return
+        index = from_state.models[app_label, self.model_name_lower].get_index_by_name(self.name)
+        if schema_editor.connection.vendor != 'postgresql':
+            schema_editor.remove_index(model, index)
+            return
+        ensure_not_in_transaction(schema_editor, type(self).__name__)
+        schema_editor.remove_index(model, index, concurrently=True)
+
+    def database_backwards(self, app_label, schema_editor, from_state, to_state):
+        model = to_state.apps.get_model(app_label, self.model_name)
+        if not self.allow_migrate_model(schema_editor.connection.alias, model):
+            return
+        index = to_state.models[app_label, self.model_name_lower].get_index_by_name(self.name)
+        if schema_editor.connection.vendor != 'postgresql':
+            schema_editor.add_index(model, index)
+            return
+        ensure_not_in_transaction(schema_editor, type(self).__name__)
+        schema_editor.add_index(model, index, concurrently=True)
+
+    def describe(self):
+        return f'{super().describe()} concurrently'
+
+
+def backfill_in_batches(queryset, update, batch_size=BACKFILL_BATCH_SIZE, pause=BACKFILL_PAUSE_SECONDS):
+    """
+    Call update(batch) over `queryset` in pk order, `batch_size` rows per
+    transaction and `pause` seconds between batches; `batch` is a queryset
+    of those rows, usually updated with .update(). Filter `queryset` down to
+    rows still missing their value so an interrupted run can resume.
+    Returns the number of rows visited.
+    """
+    last_pk = None
+    visited = 0
+    while True:
+        batch = queryset.order_by('pk')
+        if last_pk is not None:
+            batch = batch.filter(pk__gt=last_pk)
+        pks = list(batch.values_list('pk', flat=True)[:batch_size])
+        if not pks:
+            return visited
+        with transaction.atomic(using=queryset.db):
+            update(queryset.model._base_manager.using(queryset.db).filter(pk__in=pks))
+        visited += len(pks)
+        last_pk = pks[-1]
+        if pause and len(pks) == batch_size:
+            time.sleep(pause)
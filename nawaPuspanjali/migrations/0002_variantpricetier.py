@@ -0,0 +1,32 @@
+# Generated by Django 6.0.1 on 2026-10-19 11:20
+
+import django.core.validators
+import django.db.models.deletion
+from decimal import Decimal
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('nawaPuspanjali', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VariantPriceTier',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('min_quantity', models.PositiveIntegerField(help_text='Smallest order quantity this price applies to', validators=[django.core.validators.MinValueValidator(2)])),
+                ('price_per_unit', models.DecimalField(decimal_places=2, max_digits=10, validators=[django.core.validators.MinValueValidator(Decimal('0.01'))])),
+                ('label', models.CharField(blank=True, help_text='e.g. "Dozen" or "Carton"', max_length=50)),
+                ('variant', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='price_tiers', to='nawaPuspanjali.notebookvariant')),
+            ],
+            options={
+                'verbose_name': 'Price Tier',
+                'verbose_name_plural': 'Price Tiers',
+                'ordering': ['variant', 'min_quantity'],
+                'unique_together': {('variant', 'min_quantity')},
+            },
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 6.0.1 on 2026-10-19 11:48
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('nawaPuspanjali', '0002_variantpricetier'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SimilarNotebook',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('rank', models.PositiveSmallIntegerField()),
+                ('score', models.FloatField()),
+                ('notebook', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='similar_entries', to='nawaPuspanjali.notebook')),
+                ('similar', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='nawaPuspanjali.notebook')),
+            ],
+            options={
+                'verbose_name': 'Similar Notebook',
+                'verbose_name_plural': 'Similar Notebooks',
+                'ordering': ['notebook', 'rank'],
+                'unique_together': {('notebook', 'rank')},
+            },
+        ),
+    ]
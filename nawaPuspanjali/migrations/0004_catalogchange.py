@@ -0,0 +1,56 @@
+# Generated by Django 6.0.1 on 2026-10-19 12:05
+
+from django.db import migrations, models
+
+
+# Taxonomy first so a mirror replaying the seed always has the rows that
+# notebooks and variants point to.
+SEED_ORDER = [
+    ('Brand', 'brand'),
+    ('NotebookType', 'notebook_type'),
+    ('Size', 'size'),
+    ('Ruling', 'ruling'),
+    ('Notebook', 'notebook'),
+    ('NotebookVariant', 'notebook_variant'),
+]
+
+
+def seed_changes(apps, schema_editor):
+    """Start the feed with an upsert for every existing row, so since=0 is a full snapshot"""
+    CatalogChange = apps.get_model('nawaPuspanjali', 'CatalogChange')
+    for model_name, feed_name in SEED_ORDER:
+        Model = apps.get_model('nawaPuspanjali', model_name)
+        CatalogChange.objects.bulk_create(
+            [
+                CatalogChange(model=feed_name, object_id=pk, slug=slug, action='upsert')
+                for pk, slug in Model.objects.order_by('pk').values_list('pk', 'slug').iterator()
+            ],
+            batch_size=1000,
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('nawaPuspanjali', '0003_similarnotebook'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CatalogChange',
+            fields=[
+                ('seq', models.BigAutoField(primary_key=True, serialize=False)),
+                ('model', models.CharField(max_length=30)),
+                ('object_id', models.BigIntegerField()),
+                ('slug', models.SlugField(blank=True, max_length=255)),
+                ('action', models.CharField(choices=[('upsert', 'Created or updated'), ('delete', 'Deleted')], max_length=10)),
+                ('changed_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'verbose_name': 'Catalog Change',
+                'verbose_name_plural': 'Catalog Changes',
+                'ordering': ['seq'],
+            },
+        ),
+        migrations.RunPython(seed_changes, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 6.0.1 on 2026-10-19 13:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('nawaPuspanjali', '0005_outboxevent'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='notebook',
+            name='nawaPuspanj_is_acti_2c5d6a_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='notebookvariant',
+            name='nawaPuspanj_is_acti_b6ee96_idx',
+        ),
+        migrations.AddIndex(
+            model_name='notebook',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['brand', 'notebook_type', 'name'], name='notebook_active_brand_type_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='notebook',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['name'], name='notebook_active_name_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='notebookvariant',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['notebook', 'price_per_unit'], name='variant_active_nb_price_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='notebookvariant',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['price_per_unit'], name='variant_active_price_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='notebookvariant',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['size', 'ruling'], name='variant_active_size_ruling_idx'),
+        ),
+    ]
@@ -0,0 +1,54 @@
+# Generated by Django 6.0.1 on 2026-10-19 11:20
+
+import cloudinary.models
+import django.core.files.storage
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('nawaPuspanjali', '0006_active_partial_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImageAsset',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('content_hash', models.CharField(max_length=64, unique=True)),
+                ('resource', models.CharField(help_text='Stored image value, e.g. image/upload/v1/notebooks/images/<hash>.jpg', max_length=255)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'verbose_name': 'Image Asset',
+                'verbose_name_plural': 'Image Assets',
+            },
+        ),
+        migrations.AlterField(
+            model_name='notebook',
+            name='image',
+            field=cloudinary.models.CloudinaryField(blank=True, max_length=255),
+        ),
+        migrations.CreateModel(
+            name='PendingImageUpload',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('file', models.FileField(storage=django.core.files.storage.FileSystemStorage(), upload_to='pending_uploads/%Y/%m/')),
+                ('content_hash', models.CharField(db_index=True, max_length=64)),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('done', 'Uploaded'), ('failed', 'Failed')], default='pending', max_length=10)),
+                ('attempts', models.PositiveIntegerField(default=0)),
+                ('last_error', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('processed_at', models.DateTimeField(blank=True, null=True)),
+                ('notebook', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='image_uploads', to='nawaPuspanjali.notebook')),
+            ],
+            options={
+                'verbose_name': 'Pending Image Upload',
+                'verbose_name_plural': 'Pending Image Uploads',
+                'ordering': ['id'],
+                'indexes': [models.Index(condition=models.Q(('status', 'pending')), fields=['id'], name='image_upload_pending_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,51 @@
+# Generated by Django 6.0.1 on 2026-10-19 12:05
+
+import django.db.models.expressions
+import django.db.models.functions.comparison
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('nawaPuspanjali', '0007_image_uploads'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='size',
+            name='area_mm2',
+            field=models.GeneratedField(db_persist=True, expression=django.db.models.expressions.CombinedExpression(models.Case(models.When(then=django.db.models.expressions.CombinedExpression(models.F('width'), '*', models.Value(10)), unit='cm'), models.When(then=django.db.models.expressions.CombinedExpression(models.F('width'), '*', models.Value(25.4)), unit='in'), default=models.F('width'), output_field=models.FloatField()), '*', models.Case(models.When(then=django.db.models.expressions.CombinedExpression(models.F('height'), '*', models.Value(10)), unit='cm'), models.When(then=django.db.models.expressions.CombinedExpression(models.F('height'), '*', models.Value(25.4)), unit='in'), default=models.F('height'), output_field=models.FloatField())), output_field=models.FloatField()),
+        ),
+        migrations.AddField(
+            model_name='size',
+            name='aspect_ratio',
+            field=models.GeneratedField(db_persist=True, expression=django.db.models.expressions.CombinedExpression(models.F('height'), '/', django.db.models.functions.comparison.NullIf(models.F('width'), models.Value(0.0))), output_field=models.FloatField()),
+        ),
+        migrations.AddField(
+            model_name='size',
+            name='height_mm',
+            field=models.GeneratedField(db_persist=True, expression=models.Case(models.When(then=django.db.models.expressions.CombinedExpression(models.F('height'), '*', models.Value(10)), unit='cm'), models.When(then=django.db.models.expressions.CombinedExpression(models.F('height'), '*', models.Value(25.4)), unit='in'), default=models.F('height'), output_field=models.FloatField()), output_field=models.FloatField()),
+        ),
+        migrations.AddField(
+            model_name='size',
+            name='width_mm',
+            field=models.GeneratedField(db_persist=True, expression=models.Case(models.When(then=django.db.models.expressions.CombinedExpression(models.F('width'), '*', models.Value(10)), unit='cm'), models.When(then=django.db.models.expressions.CombinedExpression(models.F('width'), '*', models.Value(25.4)), unit='in'), default=models.F('width'), output_field=models.FloatField()), output_field=models.FloatField()),
+        ),
+        migrations.AddIndex(
+            model_name='size',
+            index=models.Index(fields=['width_mm', 'height_mm'], name='nawaPuspanj_width_m_710bbe_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='size',
+            index=models.Index(fields=['height_mm'], name='nawaPuspanj_height__556599_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='size',
+            index=models.Index(fields=['area_mm2'], name='nawaPuspanj_area_mm_5bf7b5_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='size',
+            index=models.Index(fields=['aspect_ratio'], name='nawaPuspanj_aspect__b2654a_idx'),
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 6.0.1 on 2026-10-19 10:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('nawaPuspanjali', '0008_size_dimensions_mm'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SimilarityRefresh',
+            fields=[
+                ('notebook_id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('queued_at', models.DateTimeField()),
+            ],
+            options={
+                'verbose_name': 'Similarity Refresh',
+                'verbose_name_plural': 'Similarity Refreshes',
+                'ordering': ['queued_at'],
+            },
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 6.0.1 on 2026-10-19 14:10
+
+from django.db import migrations, models
+from nawaPuspanjali.migration_ops import AddIndexConcurrently
+
+
+class Migration(migrations.Migration):
+    # Concurrent index builds can't run inside a transaction.
+    atomic = False
+
+    dependencies = [
+        ('nawaPuspanjali', '0009_similarity_refresh_queue'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='outboxevent',
+            name='leased_until',
+            field=models.DateTimeField(blank=True, help_text='Claimed by a dispatcher until then', null=True),
+        ),
+        AddIndexConcurrently(
+            model_name='outboxevent',
+            index=models.Index(condition=models.Q(('dispatched_at__isnull', False)), fields=['dispatched_at'], name='outbox_dispatched_idx'),
+        ),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 6.0.1 on 2026-10-19 14:40
+
+from django.db import migrations
+from nawaPuspanjali.migration_ops import RemoveIndexConcurrently
+
+
+class Migration(migrations.Migration):
+    # Concurrent index drops can't run inside a transaction.
+    atomic = False
+
+    dependencies = [
+        ('nawaPuspanjali', '0010_outbox_lease_and_dispatched_index'),
+    ]
+
+    operations = [
+        RemoveIndexConcurrently(
+            model_name='notebookvariant',
+            name='variant_active_price_idx',
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 6.0.1 on 2026-10-19 15:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('nawaPuspanjali', '0011_drop_variant_active_price_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='pendingimageupload',
+            name='leased_until',
+            field=models.DateTimeField(blank=True, help_text='Claimed by a worker until then', null=True),
+        ),
+    ]
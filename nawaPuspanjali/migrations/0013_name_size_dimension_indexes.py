@@ -0,0 +1,33 @@
+# Generated by Django 6.0.1 on 2026-10-19 15:40
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('nawaPuspanjali', '0012_image_upload_lease'),
+    ]
+
+    operations = [
+        migrations.RenameIndex(
+            model_name='size',
+            new_name='size_width_height_mm_idx',
+            old_name='nawaPuspanj_width_m_710bbe_idx',
+        ),
+        migrations.RenameIndex(
+            model_name='size',
+            new_name='size_height_mm_idx',
+            old_name='nawaPuspanj_height__556599_idx',
+        ),
+        migrations.RenameIndex(
+            model_name='size',
+            new_name='size_area_mm2_idx',
+            old_name='nawaPuspanj_area_mm_5bf7b5_idx',
+        ),
+        migrations.RenameIndex(
+            model_name='size',
+            new_name='size_aspect_ratio_idx',
+            old_name='nawaPuspanj_aspect__b2654a_idx',
+        ),
+    ]
@@ -1,4 +1,6 @@
-from django.db import models
+from django.db import models, router, transaction
+from django.db.models.functions import NullIf
+from django.core.files.storage import FileSystemStorage
 from django.utils.text import slugify
 from decimal import Decimal
 from django.core.validators import MinValueValidator
@@ -42,8 +44,29 @@ class SlugMixin(models.Model):
         super().save(*args, **kwargs)
 
 
+class PublishedModel(models.Model):
+    """
+    Catalog row published to the change feed and outbox by signals.py.
+    A save runs in one transaction with its post_save handlers, so the
+    CatalogChange and OutboxEvent rows commit exactly when the row does,
+    also outside atomic() (deletes already run in one).
+    """
+
+    class Meta:
+        abstract = True
+
+    def save(self, *args, **kwargs):
+        using = kwargs.get('using') or router.db_for_write(type(self), instance=self)
+        with transaction.atomic(using=using, savepoint=False):
+            super().save(*args, **kwargs)
+
+
+class BrandQuerySet(models.QuerySet):
+    def active(self):
+        return self.filter(is_active=True)
+
 
-class Brand(SlugMixin, models.Model):
+class Brand(PublishedModel, SlugMixin, models.Model):
     name = models.CharField(max_length=50, unique=True)
     paper = models.CharField(max_length=200, blank=True)
     description = models.TextField(blank=True)
@@ -51,6 +74,8 @@ class Brand(SlugMixin, models.Model):
     display_order = models.PositiveIntegerField(default=0)
 
     slug_source = 'name'
+
+    objects = BrandQuerySet.as_manager()
     
     class Meta:
         ordering = ['display_order','name']
@@ -59,7 +84,7 @@ class Brand(SlugMixin, models.Model):
         return self.name
     
 
-class NotebookType(SlugMixin, models.Model):
+class NotebookType(PublishedModel, SlugMixin, models.Model):
     name = models.CharField(max_length=100, unique=True)
     description = models.TextField(blank=True)
     display_order = models.PositiveIntegerField(default=0)
@@ -72,7 +97,19 @@ class NotebookType(SlugMixin, models.Model):
     def __str__(self):
         return self.name
     
-class Size(SlugMixin, models.Model):
+MM_PER_UNIT = {'mm': 1, 'cm': 10, 'in': 25.4}
+
+
+def in_mm(field):
+    """SQL expression converting a Size dimension to millimetres"""
+    return models.Case(
+        *(models.When(unit=unit, then=models.F(field) * factor) for unit, factor in MM_PER_UNIT.items() if factor != 1),
+        default=models.F(field),
+        output_field=models.FloatField(),
+    )
+
+
+class Size(PublishedModel, SlugMixin, models.Model):
 
     choices=[('mm', 'Millimeters'), ('cm', 'Centimeters'), ('in', 'Inches')]
 
@@ -81,11 +118,31 @@ class Size(SlugMixin, models.Model):
     height = models.FloatField(default=0.0)
     unit = models.CharField(max_length=10, choices=choices, default='mm')
     display_order = models.IntegerField(default = 0)
+
+    # Dimensions normalised to millimetres, kept by the database so sizes in
+    # different units can be compared and range-filtered through an index.
+    width_mm = models.GeneratedField(expression=in_mm('width'), output_field=models.FloatField(), db_persist=True)
+    height_mm = models.GeneratedField(expression=in_mm('height'), output_field=models.FloatField(), db_persist=True)
+    area_mm2 = models.GeneratedField(
+        expression=in_mm('width') * in_mm('height'), output_field=models.FloatField(), db_persist=True,
+    )
+    # Height over width, independent of the unit; null while width is 0.
+    aspect_ratio = models.GeneratedField(
+        expression=models.F('height') / NullIf(models.F('width'), models.Value(0.0)),
+        output_field=models.FloatField(),
+        db_persist=True,
+    )
     
     slug_source =  'name'
 
     class Meta:
         ordering = ['display_order','name']
+        indexes = [
+            models.Index(fields=['width_mm', 'height_mm'], name='size_width_height_mm_idx'),
+            models.Index(fields=['height_mm'], name='size_height_mm_idx'),
+            models.Index(fields=['area_mm2'], name='size_area_mm2_idx'),
+            models.Index(fields=['aspect_ratio'], name='size_aspect_ratio_idx'),
+        ]
     
     def __str__(self):
         return self.name
@@ -95,7 +152,7 @@ class Size(SlugMixin, models.Model):
         return f'{self.width} x {self.height} {self.unit}'
 
     
-class Ruling(SlugMixin, models.Model):
+class Ruling(PublishedModel, SlugMixin, models.Model):
     name = models.CharField(max_length = 100, unique = True)
     description = models.TextField(blank=True)
 
@@ -112,7 +169,13 @@ from django.db import models
 from django.core.validators import MinValueValidator
 from decimal import Decimal
 
-class Notebook(SlugMixin, models.Model):
+class NotebookQuerySet(models.QuerySet):
+    def active(self):
+        """Notebooks shown on the storefront, served by the partial indexes below"""
+        return self.filter(is_active=True)
+
+
+class Notebook(PublishedModel, SlugMixin, models.Model):
     """
     Base notebook product - represents the general notebook
     Example: "300 No. Puspanjali Copy"
@@ -120,7 +183,10 @@ class Notebook(SlugMixin, models.Model):
     name = models.CharField(max_length=255)
     brand = models.ForeignKey(Brand, on_delete=models.CASCADE, related_name='notebooks')
     notebook_type = models.ForeignKey(NotebookType, on_delete=models.CASCADE, related_name='notebooks')
+    # Set by the background upload pipeline (images.py), so it is empty
+    # until the first upload of a new notebook has been processed.
     image = CloudinaryField(
+        blank=True,
         folder='notebooks/images',
         transformation=[
             {
@@ -142,15 +208,30 @@ class Notebook(SlugMixin, models.Model):
     
     # Slug
     slug_source = ['name', 'brand__name']
+
+    objects = NotebookQuerySet.as_manager()
     
     class Meta:
         ordering = ['brand__name', 'notebook_type__name', 'name']
         unique_together = [['name', 'brand', 'notebook_type']]
         indexes = [
             models.Index(fields=['brand', 'notebook_type']),
-            models.Index(fields=['is_active'])
+            # Public queries only ever read active rows, so index just those.
+            models.Index(
+                fields=['brand', 'notebook_type', 'name'],
+                condition=models.Q(is_active=True),
+                name='notebook_active_brand_type_idx',
+            ),
+            models.Index(fields=['name'], condition=models.Q(is_active=True), name='notebook_active_name_idx'),
         ]
     
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Lets the change feed notice when the notebook's variants appear or disappear.
+        instance._loaded_is_active = values[field_names.index('is_active')] if 'is_active' in field_names else None
+        return instance
+
     def get_slug_source(self):
         brand_name = self.brand.name if self.brand else ''
         return f"{self.name} {brand_name}"
@@ -169,7 +250,13 @@ class Notebook(SlugMixin, models.Model):
         return Ruling.objects.filter(notebook_variants__notebook=self).distinct()
 
 
-class NotebookVariant( SlugMixin, models.Model):
+class NotebookVariantQuerySet(models.QuerySet):
+    def active(self):
+        """Purchasable variants: active themselves and on an active notebook"""
+        return self.filter(is_active=True, notebook__is_active=True)
+
+
+class NotebookVariant(PublishedModel, SlugMixin, models.Model):
     """
     Specific variant of a notebook with size, ruling, price, and images
     Example: "300 No. Puspanjali Copy - Book Size - 2-lined ruling"
@@ -212,13 +299,29 @@ class NotebookVariant( SlugMixin, models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = NotebookVariantQuerySet.as_manager()
+
     
     class Meta:
         ordering = ['notebook', 'size__display_order', 'ruling__name']
         unique_together = [['notebook', 'size', 'ruling']]
         indexes = [
             models.Index(fields=['notebook', 'size', 'ruling']),
-            models.Index(fields=['is_active'])
+            # Partial indexes over active variants for the public access paths:
+            # variants of a notebook by price and the size/ruling filters. The
+            # list itself is sorted by brand and notebook name, across tables,
+            # and a price range alone matches too much of the catalog for an
+            # index on it to pay for its upkeep.
+            models.Index(
+                fields=['notebook', 'price_per_unit'],
+                condition=models.Q(is_active=True),
+                name='variant_active_nb_price_idx',
+            ),
+            models.Index(
+                fields=['size', 'ruling'],
+                condition=models.Q(is_active=True),
+                name='variant_active_size_ruling_idx',
+            ),
         ]
         verbose_name = 'Notebook Variant'
         verbose_name_plural = 'Notebook Variants'
@@ -263,4 +366,185 @@ class NotebookVariant( SlugMixin, models.Model):
         # Ensure notebook is active if variant is active
         if self.is_active and not self.notebook.is_active:
             from django.core.exceptions import ValidationError
-            raise ValidationError('Cannot activate variant when base notebook is inactive')
\ No newline at end of file
+            raise ValidationError('Cannot activate variant when base notebook is inactive')
+
+
+class VariantPriceTier(PublishedModel, models.Model):
+    """
+    Quantity price break for a variant
+    Example: 12 or more units (a dozen) at Rs. 9.50 each
+    """
+    variant = models.ForeignKey(
+        NotebookVariant,
+        on_delete=models.CASCADE,
+        related_name='price_tiers'
+    )
+    min_quantity = models.PositiveIntegerField(
+        validators=[MinValueValidator(2)],
+        help_text="Smallest order quantity this price applies to"
+    )
+    price_per_unit = models.DecimalField(
+        max_digits=10,
+        decimal_places=2,
+        validators=[MinValueValidator(Decimal('0.01'))]
+    )
+    label = models.CharField(max_length=50, blank=True, help_text='e.g. "Dozen" or "Carton"')
+
+    class Meta:
+        ordering = ['variant', 'min_quantity']
+        unique_together = [['variant', 'min_quantity']]
+        verbose_name = 'Price Tier'
+        verbose_name_plural = 'Price Tiers'
+
+    def __str__(self):
+        return f"{self.variant} - {self.min_quantity}+ @ {self.price_per_unit}"
+
+
+
+class SimilarNotebook(models.Model):
+    """
+    Precomputed nearest neighbour of a notebook, maintained by similarity.py
+    Rank 0 is the most similar notebook
+    """
+    notebook = models.ForeignKey(Notebook, on_delete=models.CASCADE, related_name='similar_entries')
+    similar = models.ForeignKey(Notebook, on_delete=models.CASCADE, related_name='+')
+    rank = models.PositiveSmallIntegerField()
+    score = models.FloatField()
+
+    class Meta:
+        ordering = ['notebook', 'rank']
+        unique_together = [['notebook', 'rank']]
+        verbose_name = 'Similar Notebook'
+        verbose_name_plural = 'Similar Notebooks'
+
+    def __str__(self):
+        return f"{self.notebook_id} -> {self.similar_id} ({self.score:.3f})"
+
+
+class SimilarityRefresh(models.Model):
+    """
+    Notebook whose neighbours need recomputing, queued by the save/delete
+    signals and drained by the refresh_similarity command
+    Not a foreign key so deleted notebooks can be queued too
+    """
+    notebook_id = models.BigIntegerField(primary_key=True)
+    queued_at = models.DateTimeField()
+
+    class Meta:
+        ordering = ['queued_at']
+        verbose_name = 'Similarity Refresh'
+        verbose_name_plural = 'Similarity Refreshes'
+
+    def __str__(self):
+        return f"{self.notebook_id} queued at {self.queued_at}"
+
+
+
+class CatalogChange(models.Model):
+    """
+    Append-only log of catalog writes, read by the /api/changes/ feed
+    Deletes are kept as tombstones so mirrors can drop rows too
+    """
+    UPSERT = 'upsert'
+    DELETE = 'delete'
+    ACTION_CHOICES = [(UPSERT, 'Created or updated'), (DELETE, 'Deleted')]
+
+    seq = models.BigAutoField(primary_key=True)
+    model = models.CharField(max_length=30)
+    object_id = models.BigIntegerField()
+    slug = models.SlugField(max_length=255, blank=True)
+    action = models.CharField(max_length=10, choices=ACTION_CHOICES)
+    changed_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['seq']
+        verbose_name = 'Catalog Change'
+        verbose_name_plural = 'Catalog Changes'
+
+    def __str__(self):
+        return f"#{self.seq} {self.action} {self.model} {self.object_id}"
+
+
+
+class OutboxEvent(models.Model):
+    """
+    Catalog event waiting to be delivered to downstream consumers
+    Written in the same transaction as the change, drained by dispatch_outbox
+    """
+    aggregate = models.CharField(max_length=30, help_text="Root the event is grouped under, e.g. notebook")
+    aggregate_id = models.BigIntegerField()
+    model = models.CharField(max_length=30)
+    object_id = models.BigIntegerField()
+    slug = models.SlugField(max_length=255, blank=True)
+    action = models.CharField(max_length=10, choices=CatalogChange.ACTION_CHOICES)
+    created_at = models.DateTimeField(auto_now_add=True)
+    dispatched_at = models.DateTimeField(null=True, blank=True)
+    leased_until = models.DateTimeField(null=True, blank=True, help_text="Claimed by a dispatcher until then")
+    attempts = models.PositiveIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+
+    class Meta:
+        ordering = ['id']
+        indexes = [
+            models.Index(fields=['id'], condition=models.Q(dispatched_at__isnull=True), name='outbox_pending_idx'),
+            # Serves the pruning of delivered rows.
+            models.Index(
+                fields=['dispatched_at'], condition=models.Q(dispatched_at__isnull=False), name='outbox_dispatched_idx',
+            ),
+        ]
+        verbose_name = 'Outbox Event'
+        verbose_name_plural = 'Outbox Events'
+
+    def __str__(self):
+        return f"{self.action} {self.model} {self.object_id} ({self.aggregate} {self.aggregate_id})"
+
+
+
+class ImageAsset(models.Model):
+    """
+    Image already uploaded to Cloudinary, keyed by the SHA-256 of its bytes
+    The same file used for several notebooks is uploaded only once
+    """
+    content_hash = models.CharField(max_length=64, unique=True)
+    resource = models.CharField(max_length=255, help_text="Stored image value, e.g. image/upload/v1/notebooks/images/<hash>.jpg")
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = 'Image Asset'
+        verbose_name_plural = 'Image Assets'
+
+    def __str__(self):
+        return self.resource
+
+
+
+class PendingImageUpload(models.Model):
+    """
+    Notebook image saved in the admin and waiting for process_image_uploads
+    The file is kept on local storage until it has been uploaded
+    """
+    PENDING = 'pending'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUS_CHOICES = [(PENDING, 'Pending'), (DONE, 'Uploaded'), (FAILED, 'Failed')]
+
+    notebook = models.ForeignKey(Notebook, on_delete=models.CASCADE, related_name='image_uploads')
+    file = models.FileField(upload_to='pending_uploads/%Y/%m/', storage=FileSystemStorage())
+    content_hash = models.CharField(max_length=64, db_index=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING)
+    attempts = models.PositiveIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+    leased_until = models.DateTimeField(null=True, blank=True, help_text="Claimed by a worker until then")
+    created_at = models.DateTimeField(auto_now_add=True)
+    processed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['id']
+        indexes = [
+            models.Index(fields=['id'], condition=models.Q(status='pending'), name='image_upload_pending_idx'),
+        ]
+        verbose_name = 'Pending Image Upload'
+        verbose_name_plural = 'Pending Image Uploads'
+
+    def __str__(self):
+        return f"{self.notebook_id} {self.content_hash[:12]} ({self.status})"
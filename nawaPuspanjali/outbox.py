@@ -0,0 +1,171 @@
+# outbox.py
+"""
+Transactional outbox for catalog change events.
+
+The model signals write an OutboxEvent in the same transaction as every
+save or delete (PublishedModel opens one around saves made outside
+atomic()), so an event exists exactly when its change committed.
+`dispatch_outbox` drains pending rows in batches, coalesces them into one
+event per aggregate (a notebook with all its variants, or a taxonomy row)
+and hands them to the configured sinks. Delivery is at-least-once: a batch
+is claimed for OUTBOX_LEASE_SECONDS in a short transaction, sent with no
+locks held, and only then marked dispatched, so rows of a dispatcher that
+dies mid-send are picked up again once the lease runs out.
+
+Changes made with QuerySet.update() send no signals and are not published.
+"""
+import json
+import logging
+import urllib.request
+from django.conf import settings
+from django.utils import timezone
+from django.utils.module_loading import import_string
+from . import queues
+from .changes import MODEL_NAMES
+from .models import CatalogChange, Notebook, NotebookVariant, OutboxEvent
+
+logger = logging.getLogger(__name__)
+
+OUTBOX_BATCH_SIZE = getattr(settings, 'OUTBOX_BATCH_SIZE', 500)
+# How long a claimed batch is hidden from other dispatchers, must outlast a send.
+OUTBOX_LEASE_SECONDS = getattr(settings, 'OUTBOX_LEASE_SECONDS', 300)
+
+
+def enqueue_event(instance, action):
+    """Queue an event for a catalog row, variants are grouped under their notebook"""
+    name = MODEL_NAMES.get(type(instance))
+    if name is None or instance.pk is None:
+        return None
+    if isinstance(instance, NotebookVariant):
+        aggregate, aggregate_id = 'notebook', instance.notebook_id
+    else:
+        aggregate, aggregate_id = name, instance.pk
+    return OutboxEvent.objects.create(
+        aggregate=aggregate,
+        aggregate_id=aggregate_id,
+        model=name,
+        object_id=instance.pk,
+        slug=getattr(instance, 'slug', '') or '',
+        action=action,
+    )
+
+
+def coalesce(rows):
+    """Fold outbox rows into one event per aggregate, in order of first appearance"""
+    events = {}
+    for row in rows:
+        key = (row.aggregate, row.aggregate_id)
+        event = events.get(key)
+        if event is None:
+            event = events[key] = {
+                'event': f'{row.aggregate}.updated',
+                'aggregate': row.aggregate,
+                'id': row.aggregate_id,
+                'slug': '',
+                'objects': {},
+                'outbox_ids': [row.pk, row.pk],
+                'occurred_at': None,
+            }
+        if row.model == row.aggregate:
+            event['slug'] = row.slug or event['slug']
+            event['event'] = f'{row.aggregate}.deleted' if row.action == CatalogChange.DELETE else f'{row.aggregate}.updated'
+        event['objects'][(row.model, row.object_id)] = {
+            'model': row.model, 'id': row.object_id, 'slug': row.slug, 'action': row.action,
+        }
+        event['outbox_ids'][1] = row.pk
+        event['occurred_at'] = row.created_at.isoformat()
+
+    # Variant-only events don't carry the notebook slug, look them up at once.
+    missing = [event['id'] for event in events.values() if event['aggregate'] == 'notebook' and not event['slug']]
+    slugs = dict(Notebook.objects.filter(pk__in=missing).values_list('pk', 'slug')) if missing else {}
+    result = []
+    for event in events.values():
+        if not event['slug']:
+            event['slug'] = slugs.get(event['id'], '')
+        event['objects'] = list(event['objects'].values())
+        result.append(event)
+    return result
+
+
+def claim_batch(batch_size=OUTBOX_BATCH_SIZE):
+    """Lease the next pending rows to this dispatcher, see queues.claim_batch"""
+    return queues.claim_batch(OutboxEvent.objects.filter(dispatched_at__isnull=True), batch_size, OUTBOX_LEASE_SECONDS)
+
+
+def dispatch_batch(sinks, batch_size=OUTBOX_BATCH_SIZE):
+    """
+    Deliver one batch of pending rows to every sink, returns (rows, events).
+    A failing sink releases the whole batch for a retry.
+    """
+    rows = claim_batch(batch_size)
+    if not rows:
+        return 0, 0
+    pks = [row.pk for row in rows]
+    try:
+        events = coalesce(rows)
+        for sink in sinks:
+            sink.send(events)
+    except Exception as exc:
+        logger.exception('Outbox dispatch failed')
+        for row in rows:
+            row.attempts += 1
+            row.last_error = repr(exc)[:1000]
+            row.leased_until = None
+        OutboxEvent.objects.bulk_update(rows, ['attempts', 'last_error', 'leased_until'])
+        raise
+    OutboxEvent.objects.filter(pk__in=pks).update(dispatched_at=timezone.now(), leased_until=None)
+    return len(rows), len(events)
+
+
+def get_sinks():
+    """Instantiate the sinks configured in settings.OUTBOX_SINKS"""
+    return [
+        import_string(config['BACKEND'])(**config.get('OPTIONS', {}))
+        for config in getattr(settings, 'OUTBOX_SINKS', [])
+    ]
+
+
+class BaseSink:
+    """Receives coalesced events; raise to have the batch retried"""
+
+    def send(self, events):
+        raise NotImplementedError
+
+
+class FileSink(BaseSink):
+    """Append events as JSON lines, a local stand-in for real consumers"""
+
+    def __init__(self, path):
+        self.path = path
+
+    def send(self, events):
+        with open(self.path, 'a') as fh:
+            for event in events:
+                fh.write(json.dumps(event) + '\n')
+
+
+class HttpSink(BaseSink):
+    """POST {"events": [...]} as JSON to a webhook"""
+
+    def __init__(self, url, timeout=10, headers=None):
+        self.url = url
+        self.timeout = timeout
+        self.headers = {'Content-Type': 'application/json', **(headers or {})}
+
+    def send(self, events):
+        request = urllib.request.Request(
+            self.url, data=json.dumps({'events': events}).encode(), headers=self.headers, method='POST',
+        )
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            if not 200 <= response.status < 300:
+                raise OSError(f'{self.url} answered {response.status}')
+
+
+class MemorySink(BaseSink):
+    """Collect events in `self.events`, for tests"""
+
+    def __init__(self):
+        self.events = []
+
+    def send(self, events):
+        self.events.extend(events)
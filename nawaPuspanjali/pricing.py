@@ -0,0 +1,138 @@
+# pricing.py
+from bisect import bisect_right
+from decimal import Decimal, ROUND_HALF_UP
+from django.conf import settings
+from django.db.models import Q
+from rest_framework.exceptions import ValidationError
+from .models import NotebookVariant
+
+QUOTE_MAX_LINES = getattr(settings, 'QUOTE_MAX_LINES', 5000)
+QUOTE_MAX_QUANTITY = getattr(settings, 'QUOTE_MAX_QUANTITY', 1000000)
+MAX_VARIANT_ID = 2**63 - 1
+CENT = Decimal('0.01')
+
+
+def parse_quote_lines(data):
+    """
+    Validate raw quote lines of the form {"variant": <slug or id>, "quantity": <int>}.
+    Kept as a plain loop rather than a nested serializer so that orders with
+    thousands of lines validate in a few milliseconds.
+    """
+    lines = data.get('lines') if isinstance(data, dict) else None
+    if not isinstance(lines, list) or not lines:
+        raise ValidationError({'lines': ['Provide a non-empty list of quote lines.']})
+    if len(lines) > QUOTE_MAX_LINES:
+        raise ValidationError({'lines': [f'A quote can contain at most {QUOTE_MAX_LINES} lines, got {len(lines)}.']})
+
+    parsed = []
+    errors = {}
+    for index, line in enumerate(lines):
+        if not isinstance(line, dict):
+            errors[index] = 'Each line must be an object with "variant" and "quantity".'
+            continue
+        key = line.get('variant')
+        quantity = line.get('quantity')
+        if isinstance(key, str) and key.isdecimal():
+            try:
+                key = int(key)
+            except ValueError:
+                # More digits than int() accepts.
+                key = None
+        if isinstance(key, bool) or not isinstance(key, (int, str)) or key == '' or (
+            isinstance(key, int) and not 0 < key <= MAX_VARIANT_ID
+        ):
+            errors[index] = '"variant" must be a variant slug or id.'
+            continue
+        if isinstance(quantity, bool) or not isinstance(quantity, int) or not 0 < quantity <= QUOTE_MAX_QUANTITY:
+            errors[index] = f'"quantity" must be an integer between 1 and {QUOTE_MAX_QUANTITY}.'
+            continue
+        parsed.append((key, quantity))
+
+    if errors:
+        raise ValidationError({'lines': errors})
+    return parsed
+
+
+def load_price_table(keys):
+    """
+    Fetch base prices and tiers for every requested variant in a single query.
+    Returns {variant_id: entry} and {slug: entry} where each entry holds the
+    availability flag plus parallel, ascending `breaks`/`prices` lists.
+    """
+    slugs = {key for key in keys if isinstance(key, str)}
+    ids = {key for key in keys if isinstance(key, int)}
+    rows = NotebookVariant.objects.filter(
+        Q(slug__in=slugs) | Q(pk__in=ids)
+    ).order_by('pk', 'price_tiers__min_quantity').values_list(
+        'pk', 'slug', 'price_per_unit', 'is_active', 'notebook__is_active',
+        'price_tiers__min_quantity', 'price_tiers__price_per_unit',
+    )
+
+    by_id = {}
+    for pk, slug, base_price, is_active, notebook_active, min_quantity, tier_price in rows:
+        entry = by_id.get(pk)
+        if entry is None:
+            entry = by_id[pk] = {
+                'id': pk,
+                'slug': slug,
+                'active': is_active and notebook_active,
+                'breaks': [1],
+                'prices': [base_price],
+            }
+        if min_quantity is not None:
+            entry['breaks'].append(min_quantity)
+            entry['prices'].append(tier_price)
+    by_slug = {entry['slug']: entry for entry in by_id.values()}
+    return by_id, by_slug
+
+
+def build_quote(lines):
+    """
+    Price a list of (variant key, quantity) lines.
+    Tiers are chosen on the total quantity of each variant across the whole
+    order, so two lines of six count as a dozen. All arithmetic is Decimal.
+    """
+    by_id, by_slug = load_price_table([key for key, _ in lines])
+
+    totals = {}
+    resolved = []
+    missing, inactive = [], []
+    for key, quantity in lines:
+        entry = by_slug.get(key) if isinstance(key, str) else by_id.get(key)
+        if entry is None:
+            missing.append(key)
+        elif not entry['active']:
+            inactive.append(key)
+        else:
+            totals[entry['id']] = totals.get(entry['id'], 0) + quantity
+            resolved.append((key, quantity, entry))
+
+    unit_prices = {}
+    for variant_id, quantity in totals.items():
+        entry = by_id[variant_id]
+        position = bisect_right(entry['breaks'], quantity) - 1
+        unit_prices[variant_id] = (entry['prices'][position], entry['breaks'][position])
+
+    quote_lines = []
+    subtotal = Decimal('0')
+    for key, quantity, entry in resolved:
+        unit_price, tier = unit_prices[entry['id']]
+        line_total = (unit_price * quantity).quantize(CENT, rounding=ROUND_HALF_UP)
+        subtotal += line_total
+        quote_lines.append({
+            'variant': key,
+            'variant_id': entry['id'],
+            'slug': entry['slug'],
+            'quantity': quantity,
+            'tier_min_quantity': tier if tier > 1 else None,
+            'unit_price': str(unit_price),
+            'line_total': str(line_total),
+        })
+
+    return {
+        'lines': quote_lines,
+        'missing': missing,
+        'inactive': inactive,
+        'total_quantity': sum(totals.values()),
+        'subtotal': str(subtotal.quantize(CENT, rounding=ROUND_HALF_UP)),
+    }
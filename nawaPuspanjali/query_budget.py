@@ -0,0 +1,129 @@
+# query_budget.py
+"""
+Query budgets and N+1 detection for tests.
+
+QueryBudgetTestRunner (runner.py, settings.TEST_RUNNER) puts
+QueryBudgetMiddleware in front of every request made during the test run.
+The middleware records the SQL each view runs, groups SELECTs by their
+normalised form and raises QueryBudgetExceeded when one of them repeats
+more than QUERY_REPEAT_THRESHOLD times (the shape of an N+1) or when the
+view runs more queries than it declares.
+
+Budgets are declared next to the views:
+- viewsets and ModelAdmins: a `query_budget` attribute, either an int or a
+  dict keyed by action ('list', 'retrieve', 'changelist', 'change', ...)
+- function views: the `query_budget(n)` decorator
+"""
+import re
+from collections import Counter
+from contextlib import ExitStack
+from django.conf import settings
+from django.db import connections
+
+QUERY_REPEAT_THRESHOLD = getattr(settings, 'QUERY_REPEAT_THRESHOLD', 3)
+
+_STRING = re.compile(r"'(?:''|[^'])*'")
+_NUMBER = re.compile(r'\b\d+(?:\.\d+)?\b')
+_PLACEHOLDER = re.compile(r'%s|\?')
+_IN_LIST = re.compile(r'\bIN\s*\(\s*\?(?:\s*,\s*\?)*\s*\)', re.IGNORECASE)
+_SPACE = re.compile(r'\s+')
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+def normalize_sql(sql):
+    """Reduce a statement to its shape: literals, parameters and IN lists become placeholders"""
+    sql = _STRING.sub('?', sql)
+    sql = _PLACEHOLDER.sub('?', sql)
+    sql = _NUMBER.sub('?', sql)
+    sql = _IN_LIST.sub('IN (...)', sql)
+    return _SPACE.sub(' ', sql).strip()
+
+
+def query_budget(budget):
+    """Declare the query budget of a function view"""
+    def decorator(view):
+        view.query_budget = budget
+        return view
+    return decorator
+
+
+class QueryInspector:
+    """Record every statement run on any database connection inside the block"""
+
+    def __init__(self):
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        self.queries.append(sql)
+        return execute(sql, params, many, context)
+
+    def __enter__(self):
+        self._stack = ExitStack()
+        for connection in connections.all():
+            self._stack.enter_context(connection.execute_wrapper(self))
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stack.close()
+
+    @property
+    def count(self):
+        return len(self.queries)
+
+    def repeated(self, threshold=QUERY_REPEAT_THRESHOLD):
+        """
+        Normalised SELECTs run more than `threshold` times, most frequent first.
+        Writes are left out: saving N rows legitimately takes N statements.
+        """
+        counts = Counter(
+            normalize_sql(sql) for sql in self.queries if sql.lstrip()[:6].upper() == 'SELECT'
+        )
+        return [(sql, n) for sql, n in counts.most_common() if n > threshold]
+
+    def check(self, budget=None, threshold=QUERY_REPEAT_THRESHOLD, label='block'):
+        repeated = self.repeated(threshold)
+        problems = []
+        if budget is not None and self.count > budget:
+            problems.append(f'{label} ran {self.count} queries, budget is {budget}')
+        for sql, n in repeated:
+            problems.append(f'{label} repeated a statement {n} times (threshold {threshold}): {sql[:300]}')
+        if problems:
+            raise QueryBudgetExceeded('\n'.join(problems))
+
+
+def budget_for(request):
+    """Return (budget or None, label) for the view that handled `request`"""
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return None, None
+    func = match.func
+    budget = getattr(func, 'query_budget', None)
+    action = None
+    if hasattr(func, 'cls'):
+        # DRF: viewsets map HTTP methods to actions.
+        budget = budget if budget is not None else getattr(func.cls, 'query_budget', None)
+        action = (getattr(func, 'actions', None) or {}).get(request.method.lower())
+    elif hasattr(func, 'model_admin'):
+        budget = getattr(func.model_admin, 'query_budget', None)
+        action = (match.url_name or '').rsplit('_', 1)[-1]
+    if isinstance(budget, dict):
+        budget = budget.get(action, budget.get('default'))
+    return budget, f'{match.view_name} [{request.method}]'
+
+
+class QueryBudgetMiddleware:
+    """Fail any request that exceeds its view's budget or repeats a statement"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with QueryInspector() as inspector:
+            response = self.get_response(request)
+        budget, label = budget_for(request)
+        inspector.check(budget, label=label or request.path)
+        return response
+
@@ -0,0 +1,85 @@
+# queues.py
+"""
+Pieces shared by the background workers that drain a table in batches
+(outbox dispatch, image uploads, similarity refresh).
+
+- claim_batch leases rows to one worker in a short transaction. Rows are
+  locked with SKIP LOCKED where supported only while they are claimed, then
+  hidden from other workers until their `leased_until` passes, so the slow
+  part of a batch runs with no locks held and the rows of a worker that
+  died are picked up again.
+- QueueCommand is the --batch-size / --loop / --interval loop of their
+  management commands.
+"""
+import time
+from datetime import timedelta
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+
+def claim_batch(queryset, batch_size, lease_seconds):
+    """
+    Lease the first `batch_size` rows of `queryset` in id order for
+    `lease_seconds` and commit, returns them. The model needs a nullable
+    `leased_until` field; `queryset` selects the rows still to be done.
+    """
+    now = timezone.now()
+    queryset = queryset.select_for_update(skip_locked=True, of=('self',))
+    with transaction.atomic(using=queryset.db):
+        rows = list(
+            queryset.filter(Q(leased_until__isnull=True) | Q(leased_until__lt=now)).order_by('id')[:batch_size]
+        )
+        if rows:
+            queryset.model._base_manager.using(queryset.db).filter(pk__in=[row.pk for row in rows]).update(
+                leased_until=now + timedelta(seconds=lease_seconds)
+            )
+    return rows
+
+
+class QueueCommand(BaseCommand):
+    """
+    Run process_batch() until a batch comes back short, then exit, or with
+    --loop sleep --interval seconds and start over. process_batch returns a
+    tuple whose first item is the number of rows taken off the queue; the
+    tuples are summed over the run and reported with `summary`.
+    """
+    batch_size = 100
+    interval = 5.0
+    summary = 'Processed {} rows'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=self.batch_size)
+        parser.add_argument('--loop', action='store_true', help='Keep polling instead of exiting once drained')
+        parser.add_argument(
+            '--interval', type=float, default=self.interval, help='Seconds to sleep when idle with --loop',
+        )
+
+    def process_batch(self, options):
+        raise NotImplementedError
+
+    def after_drain(self, options):
+        """Called once per pass, after the queue has been drained"""
+
+    def handle(self, *args, **options):
+        while True:
+            totals = None
+            while True:
+                try:
+                    counts = self.process_batch(options)
+                except Exception as exc:
+                    if not options['loop']:
+                        raise CommandError(f'Batch failed: {exc!r}')
+                    self.stderr.write(f'Batch failed, retrying: {exc!r}')
+                    break
+                totals = counts if totals is None else tuple(map(sum, zip(totals, counts)))
+                if counts[0] < options['batch_size']:
+                    break
+            if totals and totals[0]:
+                self.stdout.write(self.summary.format(*totals))
+            self.after_drain(options)
+
+            if not options['loop']:
+                return
+            time.sleep(options['interval'])
@@ -0,0 +1,19 @@
+# runner.py
+from django.conf import settings
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings
+
+
+class QueryBudgetTestRunner(DiscoverRunner):
+    """Test runner that checks the query budget of every request made by the tests"""
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self._budget_settings = override_settings(
+            MIDDLEWARE=['nawaPuspanjali.query_budget.QueryBudgetMiddleware', *settings.MIDDLEWARE]
+        )
+        self._budget_settings.enable()
+
+    def teardown_test_environment(self, **kwargs):
+        self._budget_settings.disable()
+        super().teardown_test_environment(**kwargs)
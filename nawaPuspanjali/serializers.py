@@ -1,12 +1,14 @@
 # serializers.py
 from rest_framework import serializers
-from .models import *
-from cloudinary.utils import cloudinary_url
+from django.conf import settings
+from .models import Brand, Notebook, NotebookType, NotebookVariant, Ruling, SimilarNotebook, Size, VariantPriceTier
+
+VARIANT_BATCH_MAX_SIZE = getattr(settings, 'VARIANT_BATCH_MAX_SIZE', 100)
 
 class SizeSerializer(serializers.ModelSerializer):
     class Meta:
         model = Size
-        fields = ['id', 'name', 'width', 'height', 'unit', 'slug', 'display_order']
+        fields = ['id', 'name', 'width', 'height', 'unit', 'width_mm', 'height_mm', 'slug', 'display_order']
 
 
 class RulingSerializer(serializers.ModelSerializer):
@@ -27,6 +29,12 @@ class NotebookTypeSerializer(serializers.ModelSerializer):
         fields = ['id', 'name', 'display_order', 'slug']
 
 
+class VariantPriceTierSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = VariantPriceTier
+        fields = ['min_quantity', 'price_per_unit', 'label']
+
+
 class NotebookVariantListSerializer(serializers.ModelSerializer):
     """Serializer for variant in list view"""
     size = SizeSerializer(read_only=True)
@@ -45,8 +53,8 @@ class NotebookListSerializer(serializers.ModelSerializer):
     brand = BrandSerializer(read_only=True)
     notebook_type = NotebookTypeSerializer(read_only=True)
     variants = NotebookVariantListSerializer(many=True, read_only=True)
-    available_sizes = SizeSerializer(many=True, read_only=True)
-    available_rulings = RulingSerializer(many=True, read_only=True)
+    available_sizes = serializers.SerializerMethodField()
+    available_rulings = serializers.SerializerMethodField()
     image = serializers.SerializerMethodField()
     
     class Meta:
@@ -61,6 +69,18 @@ class NotebookListSerializer(serializers.ModelSerializer):
     def get_image(self,obj):
         return obj.image.url if obj.image else None
 
+    # Built from the prefetched variants; Notebook.available_sizes and
+    # available_rulings would cost two queries per notebook in a list.
+    def get_available_sizes(self, obj):
+        sizes = {variant.size_id: variant.size for variant in obj.variants.all()}
+        ordered = sorted(sizes.values(), key=lambda size: (size.display_order, size.name))
+        return SizeSerializer(ordered, many=True).data
+
+    def get_available_rulings(self, obj):
+        rulings = {variant.ruling_id: variant.ruling for variant in obj.variants.all()}
+        ordered = sorted(rulings.values(), key=lambda ruling: ruling.name)
+        return RulingSerializer(ordered, many=True).data
+
 
 
 class NotebookVariantDetailSerializer(serializers.ModelSerializer):
@@ -70,12 +90,13 @@ class NotebookVariantDetailSerializer(serializers.ModelSerializer):
     notebook_name = serializers.CharField(source='notebook.name', read_only=True)
     notebook_brand = BrandSerializer(source='notebook.brand', read_only=True)
     notebook_type = NotebookTypeSerializer(source='notebook.notebook_type', read_only=True)
+    price_tiers = VariantPriceTierSerializer(many=True, read_only=True)
    
     class Meta:
         model = NotebookVariant
         fields = [
             'id', 'slug','notebook_name', 'notebook_brand', 'notebook_type','size', 'ruling', 'gsm', 'price_per_unit',
-            'full_description', 'display_name','is_active','created_at', 'updated_at'
+            'price_tiers', 'full_description', 'display_name','is_active','created_at', 'updated_at'
         ]
 
 
@@ -99,4 +120,92 @@ class NotebookDetailSerializer(serializers.ModelSerializer):
         ]
     
     def get_image(self,obj):
-        return obj.image.url if obj.image else None
\ No newline at end of file
+        return obj.image.url if obj.image else None
+
+
+class VariantBatchRequestSerializer(serializers.Serializer):
+    """Validates the identifiers sent to the variant batch lookup"""
+    slugs = serializers.ListField(child=serializers.SlugField(max_length=255), required=False, default=list)
+    # Bounded so an oversized id is a 400 rather than an overflow in the database driver.
+    ids = serializers.ListField(child=serializers.IntegerField(min_value=1, max_value=2**63 - 1), required=False, default=list)
+
+    def validate(self, attrs):
+        total = len(attrs['slugs']) + len(attrs['ids'])
+        if not total:
+            raise serializers.ValidationError('Provide at least one variant slug or id.')
+        if total > VARIANT_BATCH_MAX_SIZE:
+            raise serializers.ValidationError(
+                f'A batch can contain at most {VARIANT_BATCH_MAX_SIZE} variants, got {total}.'
+            )
+        return attrs
+
+
+
+class SimilarNotebookSerializer(serializers.ModelSerializer):
+    """Lightweight notebook card for the related-products strip"""
+    id = serializers.IntegerField(source='similar.id', read_only=True)
+    name = serializers.CharField(source='similar.name', read_only=True)
+    slug = serializers.CharField(source='similar.slug', read_only=True)
+    brand = serializers.CharField(source='similar.brand.name', read_only=True)
+    notebook_type = serializers.CharField(source='similar.notebook_type.name', read_only=True)
+    image = serializers.SerializerMethodField()
+
+    class Meta:
+        model = SimilarNotebook
+        fields = ['id', 'name', 'slug', 'brand', 'notebook_type', 'image', 'score']
+
+    def get_image(self, obj):
+        return obj.similar.image.url if obj.similar.image else None
+
+
+
+# Flat row serializers for the change feed: related rows are referenced by
+# id so a mirror can apply each change on its own.
+
+class BrandChangeSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Brand
+        fields = ['id', 'name', 'slug', 'paper', 'description', 'is_active', 'display_order']
+
+
+class NotebookTypeChangeSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = NotebookType
+        fields = ['id', 'name', 'slug', 'description', 'display_order']
+
+
+class SizeChangeSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Size
+        fields = ['id', 'name', 'slug', 'width', 'height', 'unit', 'width_mm', 'height_mm', 'display_order']
+
+
+class RulingChangeSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Ruling
+        fields = ['id', 'name', 'slug', 'description']
+
+
+class NotebookChangeSerializer(serializers.ModelSerializer):
+    image = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Notebook
+        fields = [
+            'id', 'name', 'slug', 'brand', 'notebook_type', 'image',
+            'base_description', 'is_active', 'created_at', 'updated_at'
+        ]
+
+    def get_image(self, obj):
+        return obj.image.url if obj.image else None
+
+
+class NotebookVariantChangeSerializer(serializers.ModelSerializer):
+    price_tiers = VariantPriceTierSerializer(many=True, read_only=True)
+
+    class Meta:
+        model = NotebookVariant
+        fields = [
+            'id', 'slug', 'notebook', 'size', 'ruling', 'gsm', 'price_per_unit', 'price_tiers',
+            'variant_description', 'is_active', 'created_at', 'updated_at'
+        ]
@@ -0,0 +1,78 @@
+# signals.py
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+from .changes import record_change
+from .models import (
+    Brand, CatalogChange, Notebook, NotebookType, NotebookVariant, Ruling, SimilarNotebook, Size, VariantPriceTier,
+)
+from .outbox import enqueue_event
+from .similarity import mark_dirty
+
+
+def publish(instance, action):
+    """Log the change for the feed and queue its outbox event, inside the caller's transaction"""
+    record_change(instance, action)
+    enqueue_event(instance, action)
+
+
+@receiver(post_save, sender=Brand)
+@receiver(post_save, sender=NotebookType)
+@receiver(post_save, sender=Size)
+@receiver(post_save, sender=Ruling)
+def taxonomy_saved(sender, instance, **kwargs):
+    publish(instance, CatalogChange.UPSERT)
+
+
+@receiver(post_delete, sender=Brand)
+@receiver(post_delete, sender=NotebookType)
+@receiver(post_delete, sender=Size)
+@receiver(post_delete, sender=Ruling)
+def taxonomy_deleted(sender, instance, **kwargs):
+    publish(instance, CatalogChange.DELETE)
+
+
+@receiver(post_save, sender=Notebook)
+def notebook_saved(sender, instance, **kwargs):
+    publish(instance, CatalogChange.UPSERT)
+    mark_dirty(instance.pk)
+    loaded_is_active = getattr(instance, '_loaded_is_active', None)
+    if loaded_is_active is not None and loaded_is_active != instance.is_active:
+        # Showing or hiding a notebook shows or hides its variants too.
+        for variant in instance.variants.all():
+            record_change(variant, CatalogChange.UPSERT)
+    instance._loaded_is_active = instance.is_active
+
+
+@receiver(pre_delete, sender=Notebook)
+def notebook_deleting(sender, instance, **kwargs):
+    # The rows pointing at the notebook are cascaded away with it, queue their
+    # owners now so they get a replacement neighbour.
+    mark_dirty(*SimilarNotebook.objects.filter(similar=instance).values_list('notebook_id', flat=True))
+
+
+@receiver(post_delete, sender=Notebook)
+def notebook_deleted(sender, instance, **kwargs):
+    publish(instance, CatalogChange.DELETE)
+    mark_dirty(instance.pk)
+
+
+@receiver(post_save, sender=NotebookVariant)
+def variant_saved(sender, instance, **kwargs):
+    publish(instance, CatalogChange.UPSERT)
+    mark_dirty(instance.notebook_id)
+
+
+@receiver(post_delete, sender=NotebookVariant)
+def variant_deleted(sender, instance, **kwargs):
+    publish(instance, CatalogChange.DELETE)
+    mark_dirty(instance.notebook_id)
+
+
+@receiver([post_save, post_delete], sender=VariantPriceTier)
+def price_tier_changed(sender, instance, **kwargs):
+    # Tiers are published as part of their variant.
+    try:
+        variant = instance.variant
+    except NotebookVariant.DoesNotExist:
+        return
+    publish(variant, CatalogChange.UPSERT)
@@ -0,0 +1,269 @@
+# similarity.py
+"""
+Offline "similar notebooks" index.
+
+Every active notebook is turned into a feature vector built from its active
+variants (sizes, rulings, GSM values, price bands) plus its brand and type.
+Neighbours are ranked by cosine similarity and the top K per notebook are
+stored in SimilarNotebook, so serving them is a single indexed lookup.
+
+Saves only queue the notebook in SimilarityRefresh; the refresh_similarity
+command recomputes the queued notebooks outside the request, loading just
+the notebooks that share a feature with them.
+"""
+import math
+from decimal import Decimal
+from functools import reduce
+from operator import or_
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Exists, Min, OuterRef, Q
+from django.utils import timezone
+from .models import Notebook, NotebookVariant, SimilarityRefresh, SimilarNotebook
+
+SIMILARITY_TOP_K = getattr(settings, 'SIMILARITY_TOP_K', 8)
+SIMILARITY_REFRESH_BATCH_SIZE = getattr(settings, 'SIMILARITY_REFRESH_BATCH_SIZE', 100)
+
+# Relative weight of each feature block in the final vector.
+FEATURE_WEIGHTS = {
+    'size': 1.0,
+    'ruling': 1.0,
+    'type': 1.5,
+    'brand': 0.75,
+    'gsm': 0.5,
+    'price': 0.75,
+}
+
+# Rows multiplied per step during a full build, bounds memory to
+# BLOCK_SIZE x catalog size floats.
+BLOCK_SIZE = 1024
+
+
+def price_band(price):
+    """Logarithmic price band: band n covers [1.5**n, 1.5**(n+1)), negative below 1"""
+    return math.floor(math.log(max(float(price), 0.01), 1.5))
+
+
+def load_catalog(notebooks=None):
+    """
+    Return (notebook ids, {block: {notebook_id: set of categories}}) for the
+    active catalog, or only for the active notebooks in the `notebooks` queryset
+    """
+    variants = NotebookVariant.objects.active()
+    if notebooks is None:
+        notebooks = Notebook.objects.active()
+    else:
+        notebooks = notebooks.filter(is_active=True)
+        variants = variants.filter(notebook__in=notebooks.values('pk'))
+    features = {block: {} for block in FEATURE_WEIGHTS}
+    notebook_ids = []
+    for pk, brand_id, type_id in notebooks.order_by('pk').values_list('pk', 'brand_id', 'notebook_type_id'):
+        notebook_ids.append(pk)
+        features['brand'][pk] = {brand_id}
+        features['type'][pk] = {type_id}
+
+    variants = variants.order_by().values_list('notebook_id', 'size_id', 'ruling_id', 'gsm', 'price_per_unit')
+    for notebook_id, size_id, ruling_id, gsm, price in variants:
+        features['size'].setdefault(notebook_id, set()).add(size_id)
+        features['ruling'].setdefault(notebook_id, set()).add(ruling_id)
+        features['price'].setdefault(notebook_id, set()).add(price_band(price))
+        if gsm:
+            features['gsm'].setdefault(notebook_id, set()).add(gsm)
+    return notebook_ids, features
+
+
+def related_notebooks(features):
+    """
+    Active notebooks sharing at least one category with the notebooks in
+    `features`. Every other notebook scores 0 against them, so they are the
+    only candidate neighbours.
+    """
+    def values(block):
+        return {value for categories in features[block].values() for value in categories}
+
+    variant_filters = [
+        Q(size__in=values('size')),
+        Q(ruling__in=values('ruling')),
+        Q(gsm__in=values('gsm')),
+    ]
+    # The band of a price is computed in Python, so match a slightly wider range.
+    variant_filters.extend(
+        Q(price_per_unit__gte=Decimal(1.5 ** band * 0.999), price_per_unit__lt=Decimal(1.5 ** (band + 1) * 1.001))
+        for band in values('price')
+    )
+    variants = NotebookVariant.objects.active().filter(reduce(or_, variant_filters), notebook=OuterRef('pk'))
+    return Notebook.objects.active().filter(
+        Q(brand__in=values('brand')) | Q(notebook_type__in=values('type')) | Exists(variants)
+    )
+
+
+def build_matrix(notebook_ids, features):
+    """
+    Stack one L2-normalised multi-hot block per feature, scale it by its
+    weight and normalise the full rows so a dot product is a cosine.
+    """
+    import numpy as np
+
+    row_of = {pk: row for row, pk in enumerate(notebook_ids)}
+    blocks = []
+    for block, weight in FEATURE_WEIGHTS.items():
+        values = features[block]
+        columns = {value: column for column, value in enumerate(sorted({v for vs in values.values() for v in vs}))}
+        matrix = np.zeros((len(notebook_ids), max(len(columns), 1)), dtype=np.float32)
+        for pk, categories in values.items():
+            row = row_of.get(pk)
+            if row is not None:
+                matrix[row, [columns[value] for value in categories]] = 1.0
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        np.divide(matrix, norms, out=matrix, where=norms > 0)
+        blocks.append(matrix * weight)
+
+    matrix = np.hstack(blocks)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    np.divide(matrix, norms, out=matrix, where=norms > 0)
+    return matrix
+
+
+def top_k(matrix, rows, k):
+    """Return (neighbour rows, scores) of the k best non-self matches for each of `rows`"""
+    import numpy as np
+
+    scores = matrix[rows] @ matrix.T
+    scores[np.arange(len(rows)), rows] = -np.inf
+    k = min(k, matrix.shape[0] - 1)
+    if k <= 0:
+        empty = np.empty((len(rows), 0))
+        return empty.astype(int), empty
+    candidates = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    candidate_scores = np.take_along_axis(scores, candidates, axis=1)
+    order = np.argsort(-candidate_scores, axis=1, kind='stable')
+    return np.take_along_axis(candidates, order, axis=1), np.take_along_axis(candidate_scores, order, axis=1)
+
+
+def _write_rows(notebook_ids, matrix, rows, k):
+    """Replace the stored neighbours of the notebooks at `rows`"""
+    entries = []
+    for start in range(0, len(rows), BLOCK_SIZE):
+        chunk = rows[start:start + BLOCK_SIZE]
+        neighbours, scores = top_k(matrix, chunk, k)
+        for row, row_neighbours, row_scores in zip(chunk, neighbours, scores):
+            rank = 0
+            for neighbour, score in zip(row_neighbours, row_scores):
+                if score <= 0:
+                    break
+                entries.append(SimilarNotebook(
+                    notebook_id=notebook_ids[row],
+                    similar_id=notebook_ids[neighbour],
+                    rank=rank,
+                    score=float(score),
+                ))
+                rank += 1
+
+    with transaction.atomic():
+        SimilarNotebook.objects.filter(notebook_id__in=[notebook_ids[row] for row in rows]).delete()
+        SimilarNotebook.objects.bulk_create(entries, batch_size=1000)
+    return len(entries)
+
+
+def build_similarity_index(k=SIMILARITY_TOP_K):
+    """Rebuild the whole index, returns the number of stored neighbour rows"""
+    notebook_ids, features = load_catalog()
+    SimilarNotebook.objects.exclude(notebook_id__in=notebook_ids).delete()
+    if not notebook_ids:
+        return 0
+    matrix = build_matrix(notebook_ids, features)
+    return _write_rows(notebook_ids, matrix, list(range(len(notebook_ids))), k)
+
+
+def refresh_similarity(changed_ids, k=SIMILARITY_TOP_K):
+    """
+    Incrementally refresh the index after `changed_ids` notebooks changed.
+    Besides the changed notebooks themselves, only rows that pointed at a
+    changed notebook, or that a changed notebook now beats, are rewritten,
+    each ranked against the notebooks it shares a category with.
+    """
+    import numpy as np
+
+    changed_ids = set(changed_ids)
+    changed = Notebook.objects.filter(pk__in=changed_ids)
+    active_changed, changed_features = load_catalog(changed)
+    SimilarNotebook.objects.filter(notebook_id__in=changed_ids).exclude(notebook_id__in=active_changed).delete()
+
+    pointing_at_changed = set(
+        SimilarNotebook.objects.filter(similar_id__in=changed_ids).values_list('notebook_id', flat=True)
+    )
+    scope = Notebook.objects.filter(pk__in=pointing_at_changed) | changed
+    if active_changed:
+        scope = scope | related_notebooks(changed_features)
+    notebook_ids, features = load_catalog(scope)
+    if not notebook_ids:
+        return 0
+
+    row_of = {pk: row for row, pk in enumerate(notebook_ids)}
+    matrix = build_matrix(notebook_ids, features)
+    changed_rows = [row_of[pk] for pk in active_changed]
+    floors = {
+        row['notebook_id']: (row['count'], row['floor'])
+        for row in SimilarNotebook.objects.filter(notebook_id__in=notebook_ids).order_by().values(
+            'notebook_id'
+        ).annotate(count=Count('pk'), floor=Min('score'))
+    }
+
+    affected = set(changed_rows)
+    if changed_rows:
+        # Score of every notebook in scope against every changed notebook.
+        against_changed = matrix @ matrix[changed_rows].T
+        against_changed[changed_rows, np.arange(len(changed_rows))] = -np.inf
+        best_new = against_changed.max(axis=1)
+    else:
+        best_new = np.full(len(notebook_ids), -np.inf)
+
+    for row, pk in enumerate(notebook_ids):
+        count, floor = floors.get(pk, (0, 0.0))
+        if pk in pointing_at_changed:
+            affected.add(row)
+        elif best_new[row] > 0 and (count < k or best_new[row] > floor):
+            affected.add(row)
+
+    if not affected:
+        return 0
+    affected_ids = [notebook_ids[row] for row in sorted(affected)]
+    # Rows that lost a neighbour may need one from outside the current scope.
+    _, affected_features = load_catalog(Notebook.objects.filter(pk__in=affected_ids))
+    notebook_ids, features = load_catalog(
+        related_notebooks(affected_features) | Notebook.objects.filter(pk__in=affected_ids)
+    )
+    row_of = {pk: row for row, pk in enumerate(notebook_ids)}
+    matrix = build_matrix(notebook_ids, features)
+    return _write_rows(notebook_ids, matrix, [row_of[pk] for pk in affected_ids], k)
+
+
+def mark_dirty(*notebook_ids):
+    """
+    Queue notebooks for refresh_pending(), inside the caller's transaction so
+    a rollback drops them too. Queuing a notebook again moves its queued_at
+    forward, which keeps a refresh that is already running from dequeuing it.
+    """
+    if not getattr(settings, 'SIMILARITY_REFRESH_ON_SAVE', True) or not notebook_ids:
+        return
+    now = timezone.now()
+    SimilarityRefresh.objects.bulk_create(
+        [SimilarityRefresh(notebook_id=pk, queued_at=now) for pk in set(notebook_ids)],
+        update_conflicts=True, unique_fields=['notebook_id'], update_fields=['queued_at'],
+    )
+
+
+def refresh_pending(batch_size=SIMILARITY_REFRESH_BATCH_SIZE, k=SIMILARITY_TOP_K):
+    """
+    Refresh up to `batch_size` queued notebooks, oldest first.
+    Returns (notebooks dequeued, neighbour rows written). If the refresh
+    fails the notebooks stay queued for the next run.
+    """
+    queued = list(SimilarityRefresh.objects.order_by('queued_at').values_list('notebook_id', 'queued_at')[:batch_size])
+    if not queued:
+        return 0, 0
+    written = refresh_similarity([pk for pk, _ in queued], k)
+    SimilarityRefresh.objects.filter(
+        reduce(or_, (Q(notebook_id=pk, queued_at=queued_at) for pk, queued_at in queued))
+    ).delete()
+    return len(queued), written
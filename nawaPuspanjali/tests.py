@@ -1,3 +1,1077 @@
-from django.test import TestCase
+import os
+import tempfile
+import time
+from unittest import mock, skipUnless
+from django.apps import apps
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import DEFAULT_DB_ALIAS, NotSupportedError, connection, connections, models, router
+from django.db import transaction
+from django.db.migrations.state import ProjectState
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.request import Request
+from .db_router import ReplicaRouter, pinned_to_primary, reading_from_replica, replica_aliases
+from . import images, outbox, similarity, throttling, typeahead
+from .migration_ops import AddIndexConcurrently, RemoveIndexConcurrently, backfill_in_batches
+from .models import (
+    Brand, ImageAsset, Notebook, NotebookType, NotebookVariant, OutboxEvent, PendingImageUpload, Ruling,
+    SimilarityRefresh, SimilarNotebook, Size,
+)
+from .query_budget import QueryBudgetExceeded, QueryInspector, normalize_sql
+from .views import NotebookViewSet
 
-# Create your tests here.
+
+# The manifest storage used in production needs collectstatic, which tests don't run.
+TEST_STORAGES = {
+    'default': {'BACKEND': 'django.core.files.storage.InMemoryStorage'},
+    'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+}
+
+
+def replica_router():
+    return next(r for r in router.routers if isinstance(r, ReplicaRouter))
+
+
+class CatalogTestCase(TestCase):
+    """
+    Base for tests that go through the API. The test data only exists in
+    the transaction on `default`, so reads stay off the replicas
+    (ReplicaRoutingIntegrationTests covers those). Each test starts with
+    empty throttle buckets and no typeahead index left by another test.
+    """
+
+    def setUp(self):
+        super().setUp()
+        patcher = mock.patch.object(replica_router(), 'replicas', [])
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        for reset in (throttling.reset_limiters, typeahead.reset_index):
+            reset()
+            self.addCleanup(reset)
+
+
+def make_catalog(notebooks=3, variants_per_notebook=2):
+    """Small active catalog shared by the API tests"""
+    brand = Brand.objects.create(name='Puspanjali')
+    notebook_type = NotebookType.objects.create(name='Copy')
+    sizes = [Size.objects.create(name=f'Size {i}', width=100 + i, height=200 + i) for i in range(variants_per_notebook)]
+    ruling = Ruling.objects.create(name='Single Line')
+    for n in range(notebooks):
+        notebook = Notebook.objects.create(name=f'Notebook {n}', brand=brand, notebook_type=notebook_type, image='sample')
+        for size in sizes:
+            NotebookVariant.objects.create(notebook=notebook, size=size, ruling=ruling, price_per_unit='10.00')
+
+
+class VariantBatchTests(CatalogTestCase):
+    def setUp(self):
+        super().setUp()
+        make_catalog(notebooks=3, variants_per_notebook=1)
+        self.first, self.second, self.third = NotebookVariant.objects.order_by('pk')
+
+    def test_results_in_request_order_with_missing_and_inactive(self):
+        self.third.is_active = False
+        self.third.save()
+        response = self.client.post('/api/notebook-variants/batch/', {
+            'slugs': [self.second.slug, 'no-such-variant', self.third.slug],
+            'ids': [self.first.pk, self.second.pk, 999999],
+        }, content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual([row['id'] for row in data['results']], [self.second.pk, self.first.pk])
+        self.assertEqual(data['missing'], ['no-such-variant', 999999])
+        self.assertEqual(data['inactive'], [self.third.slug])
+
+    def test_variants_of_inactive_notebooks_are_inactive(self):
+        Notebook.objects.filter(pk=self.first.notebook_id).update(is_active=False)
+        data = self.client.get(f'/api/notebook-variants/batch/?ids={self.first.pk},{self.second.pk}').json()
+        self.assertEqual(([row['id'] for row in data['results']], data['inactive']), ([self.second.pk], [self.first.pk]))
+
+    def test_invalid_batches(self):
+        from .serializers import VARIANT_BATCH_MAX_SIZE
+        ids = ','.join(str(n) for n in range(1, VARIANT_BATCH_MAX_SIZE + 2))
+        self.assertEqual(self.client.get(f'/api/notebook-variants/batch/?ids={ids}').status_code, 400)
+        self.assertEqual(self.client.get('/api/notebook-variants/batch/').status_code, 400)
+        self.assertIn('ids', self.client.get(f'/api/notebook-variants/batch/?ids={2**63}').json())
+
+
+class QuoteTests(CatalogTestCase):
+    def setUp(self):
+        super().setUp()
+        make_catalog(notebooks=2, variants_per_notebook=1)
+        self.variant, self.other = NotebookVariant.objects.order_by('pk')
+        self.variant.price_tiers.create(min_quantity=12, price_per_unit='9.50', label='Dozen')
+        self.variant.price_tiers.create(min_quantity=100, price_per_unit='8.75')
+        NotebookVariant.objects.filter(pk=self.other.pk).update(price_per_unit='0.10')
+
+    def quote(self, lines):
+        return self.client.post('/api/quote/', {'lines': lines}, content_type='application/json')
+
+    def test_tier_is_chosen_on_the_variant_total(self):
+        data = self.quote([
+            {'variant': self.variant.slug, 'quantity': 6},
+            {'variant': str(self.variant.pk), 'quantity': 6},
+            {'variant': self.other.pk, 'quantity': 3},
+        ]).json()
+        self.assertEqual(
+            [(line['unit_price'], line['tier_min_quantity'], line['line_total']) for line in data['lines']],
+            [('9.50', 12, '57.00'), ('9.50', 12, '57.00'), ('0.10', None, '0.30')],
+        )
+        self.assertEqual((data['total_quantity'], data['subtotal']), (15, '114.30'))
+
+        prices = [self.quote([{'variant': self.variant.slug, 'quantity': n}]).json()['lines'][0]['unit_price']
+                  for n in (11, 12, 99, 100)]
+        self.assertEqual(prices, ['10.00', '9.50', '9.50', '8.75'])
+
+    def test_missing_and_inactive_variants(self):
+        NotebookVariant.objects.filter(pk=self.other.pk).update(is_active=False)
+        data = self.quote([
+            {'variant': self.other.slug, 'quantity': 1},
+            {'variant': 'no-such-variant', 'quantity': 1},
+            {'variant': '²', 'quantity': 1},
+        ]).json()
+        self.assertEqual((data['lines'], data['missing'], data['inactive']), ([], ['no-such-variant', '²'], [self.other.slug]))
+        self.assertEqual(data['subtotal'], '0.00')
+
+    def test_invalid_lines(self):
+        for lines in ([], [{'variant': self.variant.slug}], [{'variant': self.variant.slug, 'quantity': 0}],
+                      [{'variant': True, 'quantity': 1}], [{'variant': 2**63, 'quantity': 1}],
+                      [{'variant': '9' * 5000, 'quantity': 1}]):
+            with self.subTest(lines=lines):
+                self.assertEqual(self.quote(lines).status_code, 400)
+
+
+class SimilarityTests(CatalogTestCase):
+    def setUp(self):
+        super().setUp()
+        brand = Brand.objects.create(name='Puspanjali')
+        copy, register = NotebookType.objects.create(name='Copy'), NotebookType.objects.create(name='Register')
+        self.a4, self.a5 = Size.objects.create(name='A4', width=210, height=297), Size.objects.create(name='A5', width=148, height=210)
+        ruling = Ruling.objects.create(name='Single Line')
+        self.notebooks = {}
+        for name, notebook_type, size in (('A', copy, self.a4), ('B', copy, self.a4), ('C', copy, self.a5),
+                                          ('D', register, self.a5), ('E', register, self.a5)):
+            notebook = Notebook.objects.create(name=name, brand=brand, notebook_type=notebook_type, image='sample')
+            # B only differs from A by its GSM, which keeps every ranking free of ties.
+            NotebookVariant.objects.create(notebook=notebook, size=size, ruling=ruling, price_per_unit='10.00',
+                                           gsm=70 if name == 'B' else 0)
+            self.notebooks[name] = notebook
+        similarity.build_similarity_index(k=3)
+        SimilarityRefresh.objects.all().delete()
+
+    def neighbours(self, name):
+        return [entry.similar.name for entry in self.notebooks[name].similar_entries.order_by('rank')]
+
+    def snapshot(self):
+        # Scores in rank order per notebook, which doesn't depend on how ties were broken.
+        scores = {}
+        for notebook_id, score in SimilarNotebook.objects.order_by('notebook', 'rank').values_list('notebook_id', 'score'):
+            scores.setdefault(notebook_id, []).append(round(score, 5))
+        return scores
+
+    def assertMatchesFullBuild(self):
+        refreshed = self.snapshot()
+        similarity.build_similarity_index(k=3)
+        self.assertEqual(refreshed, self.snapshot())
+
+    def test_neighbours_ranked_by_shared_features(self):
+        self.assertEqual(self.neighbours('A'), ['B', 'C', 'D'])
+        self.assertEqual(self.neighbours('D'), ['E', 'C', 'A'])
+        response = self.client.get(f'/api/notebooks/{self.notebooks["A"].slug}/similar/')
+        self.assertEqual([row['name'] for row in response.json()], ['B', 'C', 'D'])
+
+    def test_saves_are_queued_and_refreshed_incrementally(self):
+        # F only has a price below 1 in common with C once C is repriced.
+        other = Notebook.objects.create(name='F', brand=Brand.objects.create(name='Camel'),
+                                        notebook_type=NotebookType.objects.create(name='Diary'), image='sample')
+        NotebookVariant.objects.create(notebook=other, size=Size.objects.create(name='Pocket', width=90, height=140),
+                                       ruling=Ruling.objects.create(name='Plain'), price_per_unit='0.80')
+        similarity.build_similarity_index(k=3)
+        SimilarityRefresh.objects.all().delete()
+        self.notebooks['F'] = other
+
+        before = self.snapshot()
+        variant = self.notebooks['C'].variants.get()
+        variant.size = self.a4
+        variant.price_per_unit = '0.90'
+        variant.save()
+        self.assertEqual(self.snapshot(), before)
+        self.assertEqual(list(SimilarityRefresh.objects.values_list('notebook_id', flat=True)), [self.notebooks['C'].pk])
+
+        dequeued, written = similarity.refresh_pending(k=3)
+        self.assertEqual(dequeued, 1)
+        self.assertGreater(written, 0)
+        self.assertFalse(SimilarityRefresh.objects.exists())
+        self.assertEqual(self.neighbours('C')[:2], ['A', 'B'])
+        self.assertEqual(self.neighbours('F'), ['C'])
+        self.assertMatchesFullBuild()
+
+    def test_deleted_and_deactivated_notebooks_are_replaced(self):
+        self.notebooks['B'].delete()
+        self.notebooks['E'].is_active = False
+        self.notebooks['E'].save()
+        queued = SimilarityRefresh.objects.count()
+        self.assertEqual(similarity.refresh_pending(k=3), (queued, mock.ANY))
+        self.assertFalse(SimilarityRefresh.objects.exists())
+        self.assertNotIn('B', self.neighbours('A'))
+        self.assertNotIn('E', self.neighbours('D'))
+        self.assertFalse(self.notebooks['E'].similar_entries.exists())
+        self.assertMatchesFullBuild()
+
+
+class ChangeFeedTests(CatalogTestCase):
+    def setUp(self):
+        super().setUp()
+        make_catalog(notebooks=2, variants_per_notebook=1)
+
+    def poll(self, since=0, limit=None):
+        url = f'/api/changes/?since={since}' + (f'&limit={limit}' if limit else '')
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def sync(self, since=0, limit=3):
+        """Follow the cursor to the end, returns ({(model, id): change}, cursor, pages)"""
+        mirror, pages = {}, 0
+        while True:
+            page = self.poll(since, limit)
+            pages += 1
+            for change in page['changes']:
+                self.assertGreater(change['seq'], since)
+                mirror[(change['model'], change['id'])] = change
+            if page['has_more']:
+                self.assertGreater(page['next_cursor'], since)
+            since = page['next_cursor']
+            if not page['has_more']:
+                return mirror, since, pages
+
+    def test_cursor_pages_through_every_change_once(self):
+        mirror, cursor, pages = self.sync(limit=3)
+        self.assertEqual(pages, 3)
+        self.assertEqual(sorted(model for model, _ in mirror), [
+            'brand', 'notebook', 'notebook', 'notebook_type', 'notebook_variant', 'notebook_variant', 'ruling', 'size',
+        ])
+        self.assertTrue(all(change['action'] == 'upsert' and 'data' in change for change in mirror.values()))
+        # Changes are visible as soon as they commit, and only the new ones are sent.
+        self.assertEqual(self.poll(cursor), {'changes': [], 'next_cursor': cursor, 'has_more': False})
+        notebook = Notebook.objects.first()
+        notebook.base_description = 'Updated'
+        notebook.save()
+        notebook.save()
+        page = self.poll(cursor)
+        self.assertEqual([(c['model'], c['id'], c['data']['base_description']) for c in page['changes']],
+                         [('notebook', notebook.pk, 'Updated')])
+
+    def test_deleted_and_hidden_rows_are_tombstones(self):
+        _, cursor, _ = self.sync()
+        hidden, deleted = NotebookVariant.objects.order_by('pk')
+        deleted_pk = deleted.pk
+        hidden.is_active = False
+        hidden.save()
+        deleted.delete()
+        page = self.poll(cursor)
+        self.assertEqual([(c['id'], c['action'], c['slug'], 'data' in c) for c in page['changes']],
+                         [(hidden.pk, 'delete', hidden.slug, False), (deleted_pk, 'delete', deleted.slug, False)])
+
+        # Hiding a notebook hides its variants, showing it again brings them back.
+        cursor = page['next_cursor']
+        notebook = Notebook.objects.get(pk=hidden.notebook_id)
+        NotebookVariant.objects.filter(pk=hidden.pk).update(is_active=True)
+        for is_active, action in ((False, 'delete'), (True, 'upsert')):
+            notebook.is_active = is_active
+            notebook.save()
+            page = self.poll(cursor)
+            self.assertEqual([(c['model'], c['action']) for c in page['changes']],
+                             [('notebook', action), ('notebook_variant', action)])
+            cursor = page['next_cursor']
+
+    @skipUnless(connection.vendor == 'postgresql', 'the log lock is only taken on PostgreSQL')
+    def test_writers_take_the_log_lock(self):
+        with CaptureQueriesContext(connection) as queries:
+            Notebook.objects.first().save()
+        self.assertTrue(any('pg_advisory_xact_lock' in query['sql'] for query in queries.captured_queries))
+
+    def test_invalid_parameters(self):
+        self.assertIn('since', self.client.get('/api/changes/?since=-1').json())
+        self.assertIn('limit', self.client.get('/api/changes/?limit=0').json())
+
+
+class BootConfigTests(SimpleTestCase):
+    def load_gunicorn_conf(self, **env):
+        import importlib.util
+        path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'gunicorn.conf.py')
+        spec = importlib.util.spec_from_file_location('gunicorn_conf', path)
+        module = importlib.util.module_from_spec(spec)
+        with mock.patch.dict(os.environ, env):
+            spec.loader.exec_module(module)
+        return module
+
+    def test_gunicorn_settings_from_environment(self):
+        conf = self.load_gunicorn_conf(WEB_CONCURRENCY='3', GUNICORN_THREADS='4', GUNICORN_PRELOAD='False')
+        self.assertEqual((conf.workers, conf.threads, conf.worker_class), (3, 4, 'gthread'))
+        self.assertFalse(conf.preload_app)
+        conf = self.load_gunicorn_conf(GUNICORN_THREADS='1', GUNICORN_MAX_REQUESTS='', GUNICORN_PRELOAD='')
+        self.assertEqual((conf.worker_class, conf.max_requests), ('sync', 1000))
+        self.assertTrue(conf.preload_app)
+
+    def test_importtime_report_is_parsed(self):
+        from .management.commands.boot_profile import parse_importtime
+        rows = parse_importtime(
+            'import time: self [us] | cumulative | imported package\n'
+            'import time:       120 |        120 |     cloudinary.utils\n'
+            'import time:      3218 |       3338 |   cloudinary\n'
+            'import time:       373 |       3711 | cloudinary.models\n'
+        )
+        self.assertEqual(
+            [(row['module'], row['self_ms'], row['cumulative_ms'], row['depth']) for row in rows],
+            [('cloudinary.utils', 0.12, 0.12, 2), ('cloudinary', 3.218, 3.338, 1), ('cloudinary.models', 0.373, 3.711, 0)],
+        )
+
+    @skipUnless(os.path.isdir('/proc/self'), 'needs /proc')
+    def test_memory_of_a_process_and_its_children(self):
+        import subprocess
+        import sys
+        from .management.commands.boot_profile import child_pids, read_memory
+        child = subprocess.Popen([sys.executable, '-c', 'import time; time.sleep(10)'])
+        self.addCleanup(child.wait)
+        self.addCleanup(child.kill)
+        self.assertIn(child.pid, child_pids(os.getpid()))
+        self.assertGreater(read_memory(os.getpid())['rss_mb'], 0)
+
+
+class ReplicaRouterTests(SimpleTestCase):
+    def setUp(self):
+        self.healthy = {'replica_0': True, 'replica_1': True}
+        self.router = ReplicaRouter(replicas=['replica_0', 'replica_1'], health_check=self.healthy.get)
+        self.router.check_interval = 0
+        # Start every test as a fresh request that has not written yet.
+        context = pinned_to_primary(False)
+        context.__enter__()
+        self.addCleanup(context.__exit__, None, None, None)
+
+    def test_reads_stay_on_primary_unless_flagged(self):
+        self.assertIsNone(self.router.db_for_read(Notebook))
+
+    def test_flagged_blocks_round_robin_and_stay_on_one_replica(self):
+        picks = []
+        for _ in range(3):
+            with reading_from_replica():
+                picks.append({self.router.db_for_read(model) for model in (Notebook, NotebookVariant, Size)})
+        self.assertEqual(picks, [{'replica_0'}, {'replica_1'}, {'replica_0'}])
+
+    def test_unhealthy_replica_is_skipped(self):
+        self.healthy['replica_0'] = False
+        picks = set()
+        for _ in range(4):
+            with reading_from_replica():
+                picks.add(self.router.db_for_read(Notebook))
+        self.assertEqual(picks, {'replica_1'})
+        self.healthy['replica_1'] = False
+        with reading_from_replica():
+            self.assertEqual(self.router.db_for_read(Notebook), DEFAULT_DB_ALIAS)
+
+    def test_failing_health_check_marks_replica_unhealthy(self):
+        from django.db import OperationalError
+        router = ReplicaRouter(replicas=['replica_0'])
+        connection = mock.MagicMock()
+        connection.cursor.side_effect = OperationalError('connection refused')
+        with mock.patch('nawaPuspanjali.db_router.connections', {'replica_0': connection}), \
+                self.assertLogs('nawaPuspanjali.db_router', 'WARNING'):
+            self.assertFalse(router.check_replica('replica_0'))
+        connection.close.assert_called_once()
+
+    def test_postgresql_replica_lag(self):
+        router = ReplicaRouter(replicas=['replica_0'])
+        connection = mock.MagicMock(vendor='postgresql')
+        cursor = connection.cursor.return_value.__enter__.return_value
+        with mock.patch('nawaPuspanjali.db_router.connections', {'replica_0': connection}):
+            cursor.fetchone.return_value = (0,)
+            self.assertTrue(router.check_replica('replica_0'))
+            cursor.fetchone.return_value = (router.max_lag + 1,)
+            self.assertFalse(router.check_replica('replica_0'))
+        # An idle primary sends no WAL; a replica that replayed all of it isn't lagging.
+        self.assertIn('pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0', cursor.execute.call_args[0][0])
+
+    def test_pinned_client_and_reads_after_write_use_primary(self):
+        with reading_from_replica(), pinned_to_primary(True):
+            self.assertIsNone(self.router.db_for_read(Notebook))
+        with reading_from_replica(), pinned_to_primary(False) as wrote:
+            self.assertEqual(self.router.db_for_read(Notebook), 'replica_0')
+            self.assertEqual(self.router.db_for_write(Notebook), DEFAULT_DB_ALIAS)
+            self.assertTrue(wrote())
+            self.assertIsNone(self.router.db_for_read(Notebook))
+
+
+@skipUnless(len(replica_aliases()) >= 2, 'set REPLICA_DATABASE_URLS to two databases, e.g. two SQLite files')
+@override_settings(STORAGES=TEST_STORAGES)
+class ReplicaRoutingIntegrationTests(TransactionTestCase):
+    # Replicas mirror the default test database, so the catalog has to be
+    # committed for their connections to see it.
+    databases = '__all__'
+
+    def setUp(self):
+        # Earlier tests leave health results and a position in the round-robin
+        # behind; start clean, with replicas that are always healthy so health
+        # checks don't count against the query budgets.
+        replica_router().reset()
+        self.addCleanup(replica_router().reset)
+        patcher = mock.patch.object(replica_router(), '_health_check', lambda alias: True)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        make_catalog()
+
+    def test_catalog_reads_go_to_replicas(self):
+        used = set()
+        for url in ('/api/notebooks/', '/api/notebook-variants/', '/api/filter-options/'):
+            with CaptureQueriesContext(connections['replica_0']) as first, \
+                    CaptureQueriesContext(connections['replica_1']) as second:
+                self.assertEqual(self.client.get(url).status_code, 200)
+            # Every query of a request, prefetches included, reads the same replica.
+            hit = [alias for alias, queries in (('replica_0', first), ('replica_1', second)) if queries.captured_queries]
+            self.assertEqual(len(hit), 1, url)
+            used.update(hit)
+        self.assertEqual(used, {'replica_0', 'replica_1'})
+
+    def test_admin_stays_on_primary(self):
+        from django.contrib.auth.models import User
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'pw'))
+        with CaptureQueriesContext(connections['replica_0']) as first, \
+                CaptureQueriesContext(connections['replica_1']) as second:
+            self.client.get('/admin/nawaPuspanjali/notebook/')
+        self.assertFalse(first.captured_queries + second.captured_queries)
+
+
+class OutboxTests(TestCase):
+    def setUp(self):
+        make_catalog(notebooks=2)
+        dispatched, _ = outbox.dispatch_batch([outbox.MemorySink()])
+        self.assertTrue(dispatched)
+        self.sink = outbox.MemorySink()
+
+    def test_edits_to_one_notebook_coalesce_into_one_event(self):
+        notebook = Notebook.objects.first()
+        notebook.base_description = 'Updated'
+        notebook.save()
+        for variant in notebook.variants.all():
+            variant.price_per_unit = '12.00'
+            variant.save()
+
+        rows, events = outbox.dispatch_batch([self.sink])
+        self.assertEqual((rows, events), (3, 1))
+        [event] = self.sink.events
+        self.assertEqual((event['event'], event['id'], event['slug']), ('notebook.updated', notebook.pk, notebook.slug))
+        self.assertEqual(len(event['objects']), 3)
+        self.assertFalse(OutboxEvent.objects.filter(dispatched_at__isnull=True).exists())
+
+    def test_deleting_a_notebook_publishes_a_delete(self):
+        notebook = Notebook.objects.first()
+        notebook.delete()
+        outbox.dispatch_batch([self.sink])
+        [event] = self.sink.events
+        self.assertEqual((event['event'], event['slug']), ('notebook.deleted', notebook.slug))
+
+    def test_rolled_back_changes_are_not_published(self):
+        with self.assertRaises(RuntimeError), transaction.atomic():
+            Brand.objects.create(name='Never Committed')
+            raise RuntimeError
+        self.assertEqual(outbox.dispatch_batch([outbox.MemorySink()]), (0, 0))
+
+    def test_failing_sink_leaves_batch_pending(self):
+        class BrokenSink(outbox.BaseSink):
+            def send(self, events):
+                raise OSError('unreachable')
+
+        Brand.objects.create(name='Camel')
+        with self.assertRaises(OSError), self.assertLogs('nawaPuspanjali.outbox', 'ERROR'):
+            outbox.dispatch_batch([BrokenSink()])
+        pending = OutboxEvent.objects.get(dispatched_at__isnull=True)
+        self.assertEqual((pending.attempts, pending.leased_until), (1, None))
+        self.assertEqual(outbox.dispatch_batch([self.sink]), (1, 1))
+
+    def test_sinks_run_after_the_claim_commits(self):
+        class CheckingSink(outbox.BaseSink):
+            def send(sink, events):
+                # The claim has committed, no transaction of the dispatcher is open while sending.
+                self.assertEqual(len(connection.atomic_blocks), depth)
+                self.assertTrue(OutboxEvent.objects.filter(leased_until__isnull=False).exists())
+
+        Brand.objects.create(name='Camel')
+        depth = len(connection.atomic_blocks)
+        self.assertEqual(outbox.dispatch_batch([CheckingSink()]), (1, 1))
+        self.assertFalse(OutboxEvent.objects.filter(leased_until__isnull=False).exists())
+
+    def test_claimed_rows_are_retried_once_the_lease_expires(self):
+        Brand.objects.create(name='Camel')
+        # A dispatcher that died after claiming the row.
+        self.assertEqual(len(outbox.claim_batch()), 1)
+        self.assertEqual(outbox.dispatch_batch([self.sink]), (0, 0))
+        OutboxEvent.objects.filter(dispatched_at__isnull=True).update(leased_until=timezone.now())
+        self.assertEqual(outbox.dispatch_batch([self.sink]), (1, 1))
+        self.assertEqual(self.sink.events[0]['aggregate'], 'brand')
+
+
+class ImageUploadPipelineTests(TestCase):
+    def setUp(self):
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        context = override_settings(MEDIA_ROOT=media_root.name)
+        context.enable()
+        self.addCleanup(context.disable)
+        make_catalog(notebooks=3)
+
+    def upload(self, content=b'cover bytes'):
+        return SimpleUploadedFile('cover.jpg', content, content_type='image/jpeg')
+
+    def test_same_image_is_uploaded_once(self):
+        first, second, third = Notebook.objects.all()
+        pending = [images.queue_image(first, self.upload()), images.queue_image(second, self.upload())]
+        self.assertTrue(all(os.path.exists(row.file.path) for row in pending))
+        self.assertEqual(str(Notebook.objects.get(pk=first.pk).image), 'sample')
+
+        uploader = images.FakeUploader()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(images.process_batch(uploader), (2, 1))
+        [call] = uploader.uploaded
+        self.assertEqual((call['folder'], call['size']), ('notebooks/images', len(b'cover bytes')))
+        self.assertIn('eager', call)
+        resource = ImageAsset.objects.get().resource
+        for notebook in (first, second):
+            self.assertEqual(Notebook.objects.get(pk=notebook.pk).image.get_prep_value(), resource)
+        self.assertFalse(any(os.path.exists(row.file.path) for row in pending))
+        self.assertFalse(PendingImageUpload.objects.filter(status=PendingImageUpload.PENDING).exists())
+
+        # Already on Cloudinary: swapped in at once, nothing left for the worker.
+        self.assertIsNone(images.queue_image(third, self.upload()))
+        self.assertEqual(Notebook.objects.get(pk=third.pk).image.get_prep_value(), resource)
+        self.assertEqual(len(uploader.uploaded), 1)
+
+    def test_newest_upload_of_a_notebook_wins(self):
+        notebook = Notebook.objects.first()
+        images.queue_image(notebook, self.upload(b'old'))
+        images.queue_image(notebook, self.upload(b'new'))
+        images.process_batch(images.FakeUploader())
+        new = ImageAsset.objects.get(content_hash=images.content_hash(self.upload(b'new')))
+        self.assertEqual(Notebook.objects.get(pk=notebook.pk).image.get_prep_value(), new.resource)
+
+    def test_retried_older_upload_does_not_replace_a_newer_one(self):
+        old, new = self.upload(b'old-bytes'), self.upload(b'new-bytes')
+        old_hash, new_hash = images.content_hash(old), images.content_hash(new)
+
+        class FlakyUploader(images.FakeUploader):
+            def upload(self, fileobj, public_id, **options):
+                if public_id == old_hash:
+                    raise OSError('unreachable')
+                return super().upload(fileobj, public_id, **options)
+
+        notebook = Notebook.objects.first()
+        images.queue_image(notebook, old)
+        images.queue_image(notebook, new)
+        with self.assertLogs('nawaPuspanjali.images', 'ERROR'):
+            self.assertEqual(images.process_batch(FlakyUploader()), (2, 1))
+        self.assertEqual(images.process_batch(images.FakeUploader()), (1, 1))
+        self.assertFalse(PendingImageUpload.objects.exclude(status=PendingImageUpload.DONE).exists())
+        new_resource = ImageAsset.objects.get(content_hash=new_hash).resource
+        self.assertEqual(Notebook.objects.get(pk=notebook.pk).image.get_prep_value(), new_resource)
+
+    def test_failed_upload_is_retried(self):
+        class BrokenUploader:
+            def upload(self, fileobj, public_id, **options):
+                raise OSError('unreachable')
+
+        images.queue_image(Notebook.objects.first(), self.upload())
+        with self.assertLogs('nawaPuspanjali.images', 'ERROR'):
+            self.assertEqual(images.process_batch(BrokenUploader()), (1, 0))
+        row = PendingImageUpload.objects.get()
+        self.assertEqual((row.status, row.attempts), (PendingImageUpload.PENDING, 1))
+        self.assertFalse(ImageAsset.objects.exists())
+        self.assertEqual(images.process_batch(images.FakeUploader()), (1, 1))
+
+    def test_uploads_run_outside_the_claim(self):
+        test = self
+
+        class CheckingUploader(images.FakeUploader):
+            def upload(self, fileobj, public_id, **options):
+                # The claim has committed, no transaction of the worker is open while uploading.
+                test.assertEqual(len(connection.atomic_blocks), depth)
+                test.assertTrue(PendingImageUpload.objects.filter(leased_until__isnull=False).exists())
+                return super().upload(fileobj, public_id, **options)
+
+        images.queue_image(Notebook.objects.first(), self.upload())
+        depth = len(connection.atomic_blocks)
+        self.assertEqual(images.process_batch(CheckingUploader()), (1, 1))
+        row = PendingImageUpload.objects.get()
+        self.assertEqual((row.status, row.leased_until), (PendingImageUpload.DONE, None))
+
+    def test_claimed_rows_are_retried_once_the_lease_expires(self):
+        images.queue_image(Notebook.objects.first(), self.upload())
+        # A worker that died after claiming the row.
+        self.assertEqual(len(images.claim_batch()), 1)
+        self.assertEqual(images.process_batch(images.FakeUploader()), (0, 0))
+        PendingImageUpload.objects.update(leased_until=timezone.now())
+        self.assertEqual(images.process_batch(images.FakeUploader()), (1, 1))
+
+
+class OutboxAutocommitTests(TransactionTestCase):
+    def test_save_outside_atomic_commits_with_its_event(self):
+        from django.db import DatabaseError
+        with mock.patch('nawaPuspanjali.signals.enqueue_event', side_effect=DatabaseError('outbox unavailable')):
+            with self.assertRaises(DatabaseError):
+                Brand.objects.create(name='Camel')
+        # Without a transaction around the save the brand would have committed on its own.
+        self.assertFalse(Brand.objects.exists())
+
+        Brand.objects.create(name='Camel')
+        self.assertEqual(OutboxEvent.objects.get().slug, 'camel')
+
+
+class SizeDimensionFilterTests(CatalogTestCase):
+    def setUp(self):
+        super().setUp()
+        brand = Brand.objects.create(name='Puspanjali')
+        notebook_type = NotebookType.objects.create(name='Copy')
+        ruling = Ruling.objects.create(name='Single Line')
+        self.sizes = {
+            'A4': Size.objects.create(name='A4', width=210, height=297, unit='mm'),
+            'A5': Size.objects.create(name='A5', width=14.8, height=21, unit='cm'),
+            'Letter': Size.objects.create(name='Letter', width=8.5, height=11, unit='in'),
+        }
+        for name, size in self.sizes.items():
+            notebook = Notebook.objects.create(name=f'{name} Copy', brand=brand, notebook_type=notebook_type, image='sample')
+            NotebookVariant.objects.create(notebook=notebook, size=size, ruling=ruling, price_per_unit='10.00')
+
+    def variant_sizes(self, query):
+        response = self.client.get(f'/api/notebook-variants/?{query}')
+        self.assertEqual(response.status_code, 200, response.content)
+        return sorted(row['size']['name'] for row in response.json())
+
+    def notebook_names(self, query):
+        response = self.client.get(f'/api/notebooks/?{query}')
+        self.assertEqual(response.status_code, 200, response.content)
+        return sorted(row['name'] for row in response.json())
+
+    def test_dimensions_are_normalised_to_mm(self):
+        letter = Size.objects.get(name='Letter')
+        self.assertAlmostEqual(letter.width_mm, 215.9)
+        self.assertAlmostEqual(letter.area_mm2, 215.9 * 279.4)
+        self.assertAlmostEqual(Size.objects.get(name='A5').height_mm, 210)
+        self.assertAlmostEqual(Size.objects.get(name='A4').aspect_ratio, 297 / 210)
+
+    def test_range_filters_compare_across_units(self):
+        self.assertEqual(self.variant_sizes('min_width=200'), ['A4', 'Letter'])
+        self.assertEqual(self.variant_sizes('max_height=290'), ['A5', 'Letter'])
+        self.assertEqual(self.variant_sizes('min_area=40000&max_area=61000'), ['Letter'])
+        self.assertEqual(self.notebook_names('min_width=200&max_height=290'), ['Letter Copy'])
+
+    def test_closest_to(self):
+        self.assertEqual(self.variant_sizes('closest_to=150x200'), ['A5'])
+        self.assertEqual(self.variant_sizes('closest_to=216x280'), ['Letter'])
+        self.assertEqual(self.notebook_names('closest_to=211x296'), ['A4 Copy'])
+        # Nearest among the sizes left by the other filters.
+        self.assertEqual(self.notebook_names('closest_to=150x200&min_width=200'), ['Letter Copy'])
+        response = self.client.get('/api/notebooks/?closest_to=A4')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('closest_to', response.json())
+
+    def test_price_and_gsm_filters(self):
+        NotebookVariant.objects.filter(size=self.sizes['A4']).update(price_per_unit='4.50', gsm=70)
+        self.assertEqual(self.variant_sizes('min_price=5'), ['A5', 'Letter'])
+        self.assertEqual(self.variant_sizes('max_price=5&min_width=200'), ['A4'])
+        self.assertEqual(self.variant_sizes('min_gsm=60'), ['A4'])
+
+
+class TokenBucketTests(SimpleTestCase):
+    def test_bucket_refills_over_the_period(self):
+        bucket = throttling.TokenBucket(10, 60)
+        self.assertEqual(bucket.take('a', 10, now=0), 0)
+        self.assertAlmostEqual(bucket.take('a', 1, now=0), 6)
+        self.assertEqual(bucket.take('b', 1, now=0), 0)
+        self.assertEqual(bucket.take('a', 1, now=6), 0)
+
+    @override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+    def test_sliding_window_weights_previous_window(self):
+        window = throttling.SlidingWindow(10, 60, 'default')
+        self.assertEqual(window.take('a', 8, now=600), 0)
+        self.assertEqual(window.take('a', 2, now=650), 0)
+        self.assertGreater(window.take('a', 1, now=655), 0)
+        # Half way through the next window only half of the previous counts.
+        self.assertEqual(window.take('a', 5, now=690), 0)
+        self.assertGreater(window.take('a', 1, now=690), 0)
+
+
+@override_settings(CATALOG_THROTTLE_RATES={'client': '20/min', 'global': '1000/min'})
+class CatalogThrottleTests(CatalogTestCase):
+    def setUp(self):
+        super().setUp()
+        make_catalog(notebooks=1)
+
+    def test_unfiltered_lists_cost_more_than_lookups(self):
+        variant = NotebookVariant.objects.first()
+        for _ in range(2):
+            self.assertEqual(self.client.get('/api/notebook-variants/').status_code, 200)
+        response = self.client.get('/api/notebook-variants/')
+        self.assertEqual(response.status_code, 429)
+        self.assertGreaterEqual(int(response['Retry-After']), 1)
+
+        throttling.reset_limiters()
+        for _ in range(20):
+            self.assertEqual(self.client.get(f'/api/notebook-variants/{variant.slug}/').status_code, 200)
+        self.assertEqual(self.client.get(f'/api/notebook-variants/{variant.slug}/').status_code, 429)
+
+    def test_forwarded_for_is_ignored_without_trusted_proxies(self):
+        for n in range(2):
+            self.client.get('/api/notebooks/', HTTP_X_FORWARDED_FOR=f'10.9.0.{n}')
+        # A new X-Forwarded-For per request doesn't make a new client.
+        self.assertEqual(self.client.get('/api/notebooks/', HTTP_X_FORWARDED_FOR='10.9.0.9').status_code, 429)
+
+    def test_clients_are_limited_separately(self):
+        for _ in range(2):
+            self.client.get('/api/notebooks/')
+        self.assertEqual(self.client.get('/api/notebooks/').status_code, 429)
+        self.assertEqual(self.client.get('/api/notebooks/', REMOTE_ADDR='10.0.0.2').status_code, 200)
+
+    def test_only_known_non_empty_filters_make_a_list_cheaper(self):
+        view = NotebookViewSet(action='list')
+        factory = RequestFactory()
+
+        def cost(query):
+            return throttling.request_cost(Request(factory.get(f'/api/notebooks/?{query}')), view)
+
+        self.assertEqual(cost('brand=1'), throttling.REQUEST_COSTS['list_filtered'])
+        self.assertEqual(cost('min_width=200&ordering=name'), throttling.REQUEST_COSTS['list_filtered'])
+        for query in ('', 'foo=1', 'brand=', 'brand=%20', 'ordering=name', 'search='):
+            self.assertEqual(cost(query), throttling.REQUEST_COSTS['list'], query)
+        self.assertEqual(cost('search=class&brand=1'), throttling.REQUEST_COSTS['search'])
+
+    @override_settings(CATALOG_THROTTLE_RATES={'client': '', 'global': '20/min'})
+    def test_global_limit(self):
+        for address in ('10.0.0.1', '10.0.0.2'):
+            self.client.get('/api/notebooks/', REMOTE_ADDR=address)
+        self.assertEqual(self.client.get('/api/notebooks/', REMOTE_ADDR='10.0.0.3').status_code, 429)
+
+
+class LoadSheddingTests(CatalogTestCase):
+    @override_settings(LOAD_SHED_MAX_QUEUE_MS=500)
+    def test_requests_queued_too_long_are_shed_without_queries(self):
+        stale = f't={(time.time() - 2) * 1000:.0f}'
+        with self.assertNumQueries(0):
+            response = self.client.get('/api/notebooks/', HTTP_X_REQUEST_START=stale)
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response['Retry-After'], '2')
+        fresh = f't={time.time() * 1_000_000:.0f}'
+        self.assertEqual(self.client.get('/api/notebooks/', HTTP_X_REQUEST_START=fresh).status_code, 200)
+
+    @override_settings(LOAD_SHED_MAX_QUEUE_MS=100)
+    def test_unparseable_request_start_is_ignored(self):
+        middleware = throttling.LoadSheddingMiddleware(lambda request: HttpResponse())
+        for header in ('t=inf', 't=-inf', 't=nan', 't=1e400', 't=1e30', 't=-5', 't=abc'):
+            request = RequestFactory().get('/api/notebooks/', HTTP_X_REQUEST_START=header)
+            self.assertFalse(middleware.queued_too_long(request), header)
+
+    def test_inflight_limit(self):
+        nested = []
+
+        def view(request):
+            # Another request arriving while this one runs.
+            nested.append(middleware(RequestFactory().get('/api/notebooks/')))
+            return HttpResponse()
+
+        middleware = throttling.LoadSheddingMiddleware(view)
+        middleware.max_inflight = 1
+        self.assertEqual(middleware(RequestFactory().get('/api/notebooks/')).status_code, 200)
+        self.assertEqual(nested[0].status_code, 503)
+        self.assertEqual(middleware._inflight, 0)
+
+
+class PrefixIndexTests(SimpleTestCase):
+    def setUp(self):
+        self.index = typeahead.PrefixIndex([
+            {'type': 'notebook', 'slug': 'classmate-long', 'label': 'Classmate Long Book', 'detail': 'Classmate'},
+            {'type': 'notebook', 'slug': 'spiral-copy', 'label': 'Spiral Copy', 'detail': 'Puspanjali'},
+            {'type': 'brand', 'slug': 'classmate', 'label': 'Classmate', 'detail': ''},
+            {'type': 'size', 'slug': 'a4', 'label': 'A4', 'detail': ''},
+            {'type': 'ruling', 'slug': 'four-line', 'label': 'Four Líne', 'detail': ''},
+        ])
+
+    def slugs(self, query, **kwargs):
+        return [entry['slug'] for entry in self.index.search(query, **kwargs)]
+
+    def test_prefix_of_any_word_run(self):
+        self.assertEqual(self.slugs('class'), ['classmate-long', 'classmate'])
+        self.assertEqual(self.slugs('long b'), ['classmate-long'])
+        self.assertEqual(self.slugs('COP'), ['spiral-copy'])
+        self.assertEqual(self.slugs('four line'), ['four-line'])
+        self.assertEqual(self.slugs('  '), [])
+        self.assertEqual(self.slugs('zzz'), [])
+
+    def test_limit_and_types(self):
+        self.assertEqual(self.slugs('class', limit=1), ['classmate-long'])
+        self.assertEqual(self.slugs('class', types={'brand'}), ['classmate'])
+
+    def test_short_prefixes_rank_every_match(self):
+        # More matches than a query used to scan, the best one sorting last.
+        entries = [{'type': 'ruling', 'slug': f'aa{n}', 'label': f'Aa{n:04}', 'detail': ''} for n in range(2100)]
+        entries.append({'type': 'notebook', 'slug': 'azure', 'label': 'Azure', 'detail': ''})
+        index = typeahead.PrefixIndex(entries)
+        self.assertEqual([entry['slug'] for entry in index.search('a', limit=2)], ['azure', 'aa0'])
+
+
+class TypeaheadEndpointTests(CatalogTestCase):
+    def setUp(self):
+        super().setUp()
+        make_catalog(notebooks=2)
+
+    def test_index_is_built_from_the_primary(self):
+        replicas = ReplicaRouter(replicas=['replica_0'], health_check=lambda alias: True)
+        routed = []
+
+        def version():
+            routed.append(replicas.db_for_read(Notebook))
+            return 0
+
+        # pinned_to_primary(False) forgets the writes made by setUp.
+        with mock.patch.object(typeahead, 'catalog_version', version), pinned_to_primary(False), reading_from_replica():
+            self.assertEqual(replicas.db_for_read(Notebook), 'replica_0')
+            typeahead.get_index()
+        self.assertEqual(routed, [None])
+
+    def test_served_from_memory_until_the_catalog_changes(self):
+        response = self.client.get('/api/typeahead/?q=notebook')
+        self.assertEqual([row['label'] for row in response.json()['results']], ['Notebook 0', 'Notebook 1'])
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get('/api/typeahead/?q=pusp').json()['results'][0]['type'], 'brand')
+
+        Notebook.objects.filter(name='Notebook 0').get().delete()
+        with mock.patch.object(typeahead, 'TYPEAHEAD_VERSION_CHECK_SECONDS', 0):
+            response = self.client.get('/api/typeahead/?q=notebook')
+        self.assertEqual([row['label'] for row in response.json()['results']], ['Notebook 1'])
+
+    def test_invalid_parameters(self):
+        self.assertEqual(self.client.get('/api/typeahead/?q=a&limit=0').status_code, 400)
+        self.assertIn('types', self.client.get('/api/typeahead/?q=a&types=colour').json())
+
+
+class BackfillTests(TestCase):
+    def test_backfill_runs_in_bounded_batches(self):
+        make_catalog(notebooks=5)
+        batches = []
+
+        def update(batch):
+            batches.append(batch.count())
+            batch.update(base_description='filled')
+
+        visited = backfill_in_batches(Notebook.objects.filter(base_description=''), update, batch_size=2, pause=0)
+        self.assertEqual((visited, batches), (5, [2, 2, 1]))
+        self.assertFalse(Notebook.objects.exclude(base_description='filled').exists())
+        # Rows already filled are skipped on a rerun.
+        self.assertEqual(backfill_in_batches(Notebook.objects.filter(base_description=''), update, pause=0), 0)
+
+
+class ConcurrentIndexOperationTests(TransactionTestCase):
+    """AddIndexConcurrently / RemoveIndexConcurrently, on this database and against a mocked PostgreSQL"""
+    index = models.Index(fields=['name'], name='size_name_test_idx')
+
+    def states(self):
+        add = AddIndexConcurrently('size', self.index)
+        remove = RemoveIndexConcurrently('size', self.index.name)
+        before = ProjectState.from_apps(apps)
+        added = before.clone()
+        add.state_forwards('nawaPuspanjali', added)
+        removed = added.clone()
+        remove.state_forwards('nawaPuspanjali', removed)
+        return add, remove, before, added, removed
+
+    def index_names(self):
+        with connection.cursor() as cursor:
+            return set(connection.introspection.get_constraints(cursor, Size._meta.db_table))
+
+    def postgres_editor(self, in_atomic_block=False, index_valid=None):
+        editor = mock.MagicMock()
+        editor.connection.alias = DEFAULT_DB_ALIAS
+        editor.connection.vendor = 'postgresql'
+        editor.connection.in_atomic_block = in_atomic_block
+        editor.connection.cursor.return_value.__enter__.return_value.fetchone.return_value = (
+            None if index_valid is None else (index_valid,)
+        )
+        editor.quote_name.side_effect = lambda name: f'"{name}"'
+        return editor
+
+    def test_forwards_and_backwards(self):
+        add, remove, before, added, removed = self.states()
+        with connection.schema_editor(atomic=False) as editor:
+            add.database_forwards('nawaPuspanjali', editor, before, added)
+        self.assertIn(self.index.name, self.index_names())
+        with connection.schema_editor(atomic=False) as editor:
+            remove.database_forwards('nawaPuspanjali', editor, added, removed)
+        self.assertNotIn(self.index.name, self.index_names())
+        with connection.schema_editor(atomic=False) as editor:
+            remove.database_backwards('nawaPuspanjali', editor, removed, added)
+        self.assertIn(self.index.name, self.index_names())
+        with connection.schema_editor(atomic=False) as editor:
+            add.database_backwards('nawaPuspanjali', editor, added, before)
+        self.assertNotIn(self.index.name, self.index_names())
+
+    def test_postgresql_builds_concurrently_and_replaces_invalid_indexes(self):
+        add, remove, before, added, removed = self.states()
+        editor = self.postgres_editor()
+        add.database_forwards('nawaPuspanjali', editor, before, added)
+        editor.add_index.assert_called_once_with(mock.ANY, self.index, concurrently=True)
+        editor.execute.assert_not_called()
+
+        editor = self.postgres_editor(index_valid=False)
+        add.database_forwards('nawaPuspanjali', editor, before, added)
+        editor.execute.assert_called_once_with('DROP INDEX CONCURRENTLY IF EXISTS "size_name_test_idx"')
+        editor.add_index.assert_called_once_with(mock.ANY, self.index, concurrently=True)
+
+        # Already built by an earlier run.
+        editor = self.postgres_editor(index_valid=True)
+        add.database_forwards('nawaPuspanjali', editor, before, added)
+        editor.add_index.assert_not_called()
+
+        editor = self.postgres_editor()
+        remove.database_forwards('nawaPuspanjali', editor, added, removed)
+        editor.remove_index.assert_called_once_with(mock.ANY, self.index, concurrently=True)
+
+    def test_postgresql_refuses_to_run_in_a_transaction(self):
+        add, remove, before, added, removed = self.states()
+        for operation, from_state, to_state in ((add, before, added), (remove, added, removed)):
+            editor = self.postgres_editor(in_atomic_block=True)
+            with self.assertRaises(NotSupportedError):
+                operation.database_forwards('nawaPuspanjali', editor, from_state, to_state)
+            with self.assertRaises(NotSupportedError):
+                operation.database_backwards('nawaPuspanjali', editor, to_state, from_state)
+            editor.add_index.assert_not_called()
+            editor.remove_index.assert_not_called()
+
+    def test_describe(self):
+        add, remove, *_ = self.states()
+        self.assertTrue(add.describe().endswith(' concurrently'))
+        self.assertEqual(remove.describe(), 'Remove index size_name_test_idx from size concurrently')
+
+
+class ActiveCatalogIndexTests(TestCase):
+    """The public access paths must be answered by the partial indexes"""
+
+    @classmethod
+    def setUpTestData(cls):
+        make_catalog(notebooks=5, variants_per_notebook=3)
+
+    def assertUsesIndex(self, queryset, index_name):
+        if connection.vendor == 'postgresql':
+            # Tiny test tables are always cheaper to scan, ask for the index plan.
+            with connection.cursor() as cursor:
+                cursor.execute('SET LOCAL enable_seqscan = off')
+        plan = queryset.explain()
+        self.assertIn(index_name, plan, plan)
+
+    def test_active_variants_of_notebook_by_price(self):
+        notebook = Notebook.objects.first()
+        self.assertUsesIndex(
+            NotebookVariant.objects.active().filter(notebook=notebook).order_by('price_per_unit'),
+            'variant_active_nb_price_idx',
+        )
+
+    def test_active_variants_by_size_and_ruling(self):
+        variant = NotebookVariant.objects.first()
+        self.assertUsesIndex(
+            NotebookVariant.objects.active().filter(size=variant.size_id, ruling=variant.ruling_id),
+            'variant_active_size_ruling_idx',
+        )
+
+    def test_active_notebooks_by_brand_and_type(self):
+        notebook = Notebook.objects.first()
+        self.assertUsesIndex(
+            Notebook.objects.active().filter(brand=notebook.brand_id, notebook_type=notebook.notebook_type_id),
+            'notebook_active_brand_type_idx',
+        )
+
+    def test_active_notebooks_by_name(self):
+        self.assertUsesIndex(Notebook.objects.active().order_by('name'), 'notebook_active_name_idx')
+
+    def test_active_excludes_variants_of_inactive_notebooks(self):
+        notebook = Notebook.objects.first()
+        notebook.is_active = False
+        notebook.save()
+        self.assertFalse(NotebookVariant.objects.active().filter(notebook=notebook).exists())
+        self.assertTrue(NotebookVariant.objects.filter(notebook=notebook, is_active=True).exists())
+
+
+class QueryInspectorTests(TestCase):
+    def test_normalize_sql_ignores_parameters(self):
+        self.assertEqual(
+            normalize_sql("SELECT * FROM t WHERE id = %s AND slug IN (%s, %s) AND name = 'x' LIMIT 21"),
+            'SELECT * FROM t WHERE id = ? AND slug IN (...) AND name = ? LIMIT ?',
+        )
+
+    def test_detects_n_plus_one(self):
+        make_catalog(notebooks=5)
+        with QueryInspector() as inspector:
+            for notebook in Notebook.objects.all():
+                list(notebook.available_sizes)
+        with self.assertRaises(QueryBudgetExceeded):
+            inspector.check()
+
+
+@override_settings(STORAGES=TEST_STORAGES)
+class QueryBudgetTests(CatalogTestCase):
+    """
+    Hit every catalog endpoint and admin page; QueryBudgetMiddleware (added
+    by the test runner) fails the request if it goes over its view's budget
+    or repeats a statement, so the counts must not grow with the catalog.
+    """
+    catalog_sizes = [(1, 1), (4, 3), (12, 4)]
+
+    def setUp(self):
+        super().setUp()
+        from django.contrib.auth.models import User
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'pw'))
+
+    def api_urls(self):
+        notebook = Notebook.objects.first()
+        variant = NotebookVariant.objects.first()
+        return [
+            '/api/notebooks/',
+            f'/api/notebooks/{notebook.slug}/',
+            f'/api/notebooks/{notebook.slug}/similar/',
+            '/api/notebook-variants/',
+            f'/api/notebook-variants/{variant.slug}/',
+            f'/api/notebook-variants/batch/?slugs={variant.slug}&ids={variant.pk}',
+            '/api/filter-options/',
+            '/api/changes/',
+            '/api/typeahead/?q=note',
+        ]
+
+    def admin_urls(self):
+        from django.contrib import admin
+        from django.urls import reverse
+        urls = []
+        for model, model_admin in admin.site._registry.items():
+            if model._meta.app_label != 'nawaPuspanjali':
+                continue
+            self.assertTrue(hasattr(model_admin, 'query_budget'), f'{type(model_admin).__name__} has no query_budget')
+            info = (model._meta.app_label, model._meta.model_name)
+            urls.append(reverse('admin:%s_%s_changelist' % info))
+            urls.append(reverse('admin:%s_%s_add' % info))
+            obj = model.objects.first()
+            if obj is not None:
+                urls.append(reverse('admin:%s_%s_change' % info, args=[obj.pk]))
+        return urls
+
+    def test_query_budgets_hold_across_catalog_sizes(self):
+        from .views import NotebookVariantViewSet, NotebookViewSet
+        for viewset in (NotebookViewSet, NotebookVariantViewSet):
+            self.assertTrue(hasattr(viewset, 'query_budget'), f'{viewset.__name__} has no query_budget')
+
+        for notebooks, variants in self.catalog_sizes:
+            with self.subTest(notebooks=notebooks, variants_per_notebook=variants):
+                for model in (Notebook, Brand, NotebookType, Size, Ruling):
+                    model.objects.all().delete()
+                make_catalog(notebooks=notebooks, variants_per_notebook=variants)
+                for url in self.api_urls() + self.admin_urls():
+                    self.assertEqual(self.client.get(url).status_code, 200, url)
+                response = self.client.post(
+                    '/api/quote/',
+                    {'lines': [{'variant': v.slug, 'quantity': 3} for v in NotebookVariant.objects.all()]},
+                    content_type='application/json',
+                )
+                self.assertEqual(response.status_code, 200)
@@ -0,0 +1,254 @@
+# throttling.py
+"""
+Rate limiting and load shedding for the public catalog API.
+
+Every API request costs tokens (REQUEST_COSTS): an unfiltered list or a
+search costs more than a detail lookup. CatalogClientThrottle limits each
+client and CatalogGlobalThrottle the whole process (or the whole fleet in
+shared mode), with rates from CATALOG_THROTTLE_RATES. By default the limits
+are token buckets kept in memory by each worker; setting
+CATALOG_THROTTLE_CACHE to a cache alias switches to a sliding window stored
+in that cache so every worker shares one limit.
+
+LoadSheddingMiddleware answers 503 with Retry-After before any view runs
+when the worker is saturated.
+"""
+import math
+import threading
+import time
+from collections import OrderedDict
+from django.conf import settings
+from django.core.cache import caches
+from django.http import JsonResponse
+from rest_framework.throttling import BaseThrottle
+
+# Tokens taken per request, by viewset action or URL name.
+REQUEST_COSTS = getattr(settings, 'CATALOG_REQUEST_COSTS', {
+    'list': 10,
+    'list_filtered': 3,
+    'search': 10,
+    'retrieve': 1,
+    'similar': 1,
+    'batch': 5,
+    'quote': 5,
+    'changes': 3,
+    'filter-options': 2,
+    'typeahead': 1,
+    'default': 1,
+})
+
+PERIODS = {'s': 1, 'sec': 1, 'm': 60, 'min': 60, 'h': 3600, 'hour': 3600, 'd': 86400, 'day': 86400}
+
+
+def parse_rate(rate):
+    """'300/min' -> (300, 60), None disables the limit"""
+    if not rate:
+        return None
+    limit, period = rate.split('/')
+    return int(limit), PERIODS[period]
+
+
+def request_cost(request, view):
+    action = getattr(view, 'action', None)
+    # Blank values don't narrow anything down, they are ignored by the filters.
+    params = {key for key, values in request.query_params.lists() if any(value.strip() for value in values)}
+    if 'search' in params:
+        return REQUEST_COSTS['search']
+    if action == 'list':
+        # Only the view's own filters make a list cheaper, not ordering or unknown parameters.
+        filterset_class = getattr(view, 'filterset_class', None)
+        filtered = filterset_class is not None and not params.isdisjoint(filterset_class.base_filters)
+        return REQUEST_COSTS['list_filtered' if filtered else 'list']
+    if action is None and request.resolver_match is not None:
+        action = request.resolver_match.url_name
+    return REQUEST_COSTS.get(action, REQUEST_COSTS['default'])
+
+
+class TokenBucket:
+    """
+    In-memory token buckets, one per key: `limit` tokens that refill evenly
+    over `period` seconds. The least recently used keys are dropped past
+    `max_keys`, which only ever gives a client a full bucket back.
+    """
+
+    def __init__(self, limit, period, max_keys=10000):
+        self.capacity = limit
+        self.refill = limit / period
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def take(self, key, cost, now=None):
+        """Take `cost` tokens, returns 0 when allowed or the seconds until they are available"""
+        now = time.monotonic() if now is None else now
+        cost = min(cost, self.capacity)
+        with self._lock:
+            tokens, updated = self._buckets.pop(key, (self.capacity, now))
+            tokens = min(self.capacity, tokens + (now - updated) * self.refill)
+            if tokens >= cost:
+                tokens -= cost
+                wait = 0
+            else:
+                wait = (cost - tokens) / self.refill
+            self._buckets[key] = (tokens, now)
+            if len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        return wait
+
+
+class SlidingWindow:
+    """
+    Sliding window counter in a shared cache: the previous fixed window is
+    weighted by how much of it still overlaps the sliding one. Increments use
+    cache.incr, which is atomic on Redis and Memcached.
+    """
+
+    def __init__(self, limit, period, cache_alias):
+        self.limit = limit
+        self.period = period
+        self.cache = caches[cache_alias]
+
+    def take(self, key, cost, now=None):
+        now = time.time() if now is None else now
+        window, offset = divmod(now, self.period)
+        window = int(window)
+        elapsed = offset / self.period
+        current_key, previous_key = f'throttle:{key}:{window}', f'throttle:{key}:{window - 1}'
+        counts = self.cache.get_many([current_key, previous_key])
+        current, previous = counts.get(current_key, 0), counts.get(previous_key, 0)
+        cost = min(cost, self.limit)
+
+        if previous * (1 - elapsed) + current + cost > self.limit:
+            room = self.limit - current - cost
+            if room < 0 or not previous:
+                return self.period - offset
+            # Wait until enough of the previous window has slid out.
+            return max((1 - room / previous - elapsed) * self.period, 0.001)
+
+        self.cache.add(current_key, 0, timeout=self.period * 2)
+        try:
+            self.cache.incr(current_key, cost)
+        except ValueError:
+            # Expired between add() and incr().
+            self.cache.set(current_key, cost, timeout=self.period * 2)
+        return 0
+
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+def get_limiter(scope):
+    """Limiter for a scope, shared by the whole process; None when the scope has no rate"""
+    rate = parse_rate(getattr(settings, 'CATALOG_THROTTLE_RATES', {}).get(scope))
+    if rate is None:
+        return None
+    cache_alias = getattr(settings, 'CATALOG_THROTTLE_CACHE', None)
+    key = (scope, rate, cache_alias)
+    with _limiters_lock:
+        if key not in _limiters:
+            _limiters[key] = SlidingWindow(*rate, cache_alias) if cache_alias else TokenBucket(*rate)
+        return _limiters[key]
+
+
+def reset_limiters():
+    """Forget all buckets, for tests"""
+    with _limiters_lock:
+        _limiters.clear()
+
+
+class CatalogThrottle(BaseThrottle):
+    scope = None
+
+    def __init__(self):
+        self.limiter = get_limiter(self.scope)
+        self.wait_seconds = None
+
+    def get_key(self, request):
+        raise NotImplementedError
+
+    def allow_request(self, request, view):
+        if self.limiter is None:
+            return True
+        self.wait_seconds = self.limiter.take(self.get_key(request), request_cost(request, view))
+        return not self.wait_seconds
+
+    def wait(self):
+        return self.wait_seconds
+
+
+class CatalogClientThrottle(CatalogThrottle):
+    """Per client, identified by IP (see REST_FRAMEWORK['NUM_PROXIES'])"""
+    scope = 'client'
+
+    def get_key(self, request):
+        return f'client:{self.get_ident(request)}'
+
+
+class CatalogGlobalThrottle(CatalogThrottle):
+    """Across all clients, caps what scrapers rotating addresses can take"""
+    scope = 'global'
+
+    def get_key(self, request):
+        return 'global'
+
+
+class LoadSheddingMiddleware:
+    """
+    Refuse requests under LOAD_SHED_PATHS with a 503 and Retry-After, before
+    sessions, views or the database are touched, when this worker is
+    saturated:
+    - more than LOAD_SHED_MAX_INFLIGHT requests are running in it, or
+    - the request waited more than LOAD_SHED_MAX_QUEUE_MS in front of it,
+      going by the X-Request-Start header set by the proxy ("t=<ms>" or
+      "t=<us>", as sent by nginx and most routers).
+    Both checks are off when their setting is 0.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.max_inflight = getattr(settings, 'LOAD_SHED_MAX_INFLIGHT', 0)
+        self.max_queue_ms = getattr(settings, 'LOAD_SHED_MAX_QUEUE_MS', 0)
+        self.retry_after = getattr(settings, 'LOAD_SHED_RETRY_AFTER', 2)
+        self.paths = tuple(getattr(settings, 'LOAD_SHED_PATHS', ('/api/',)))
+        self._inflight = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, request):
+        if not request.path.startswith(self.paths):
+            return self.get_response(request)
+        with self._lock:
+            self._inflight += 1
+            inflight = self._inflight
+        try:
+            if (self.max_inflight and inflight > self.max_inflight) or self.queued_too_long(request):
+                return self.shed()
+            return self.get_response(request)
+        finally:
+            with self._lock:
+                self._inflight -= 1
+
+    def queued_too_long(self, request):
+        header = request.META.get('HTTP_X_REQUEST_START')
+        if not self.max_queue_ms or not header:
+            return False
+        try:
+            started = float(header.strip().removeprefix('t='))
+        except ValueError:
+            return False
+        # inf, nan or nonsense is treated as no header at all.
+        if not math.isfinite(started) or started <= 0:
+            return False
+        # Seconds, milliseconds or microseconds since the epoch.
+        now = time.time()
+        for _ in range(2):
+            if started > now * 10:
+                started /= 1000
+        if started > now * 10:
+            return False
+        return (now - started) * 1000 > self.max_queue_ms
+
+    def shed(self):
+        response = JsonResponse({'detail': 'Server is busy, please retry shortly.'}, status=503)
+        response['Retry-After'] = str(math.ceil(self.retry_after))
+        return response
@@ -0,0 +1,180 @@
+# typeahead.py
+"""
+In-memory prefix index for the storefront search box.
+
+Each process keeps a sorted array of normalised keys, one per word
+position of every notebook, brand, type, size and ruling name, so a prefix
+lookup is a binary search followed by picking the best ranks of the
+matching range; results are memoised per query. The index is tagged with
+the catalog version (the latest CatalogChange seq) and rebuilt lazily when
+that moves on. The version and the entries are read from the primary, so a
+lagging replica can't tag old rows with a new version. The version is read
+at most every TYPEAHEAD_VERSION_CHECK_SECONDS, every other request is
+served from memory.
+
+Writes that don't bump the version (QuerySet.update()) are picked up once
+the index is TYPEAHEAD_MAX_AGE_SECONDS old.
+"""
+import heapq
+import re
+import threading
+import time
+import unicodedata
+from bisect import bisect_left
+from django.conf import settings
+from rest_framework.exceptions import ValidationError
+from .db_router import reading_from_replica
+from .models import Brand, CatalogChange, Notebook, NotebookType, Ruling, Size
+
+TYPEAHEAD_DEFAULT_RESULTS = getattr(settings, 'TYPEAHEAD_DEFAULT_RESULTS', 8)
+TYPEAHEAD_MAX_RESULTS = getattr(settings, 'TYPEAHEAD_MAX_RESULTS', 20)
+TYPEAHEAD_VERSION_CHECK_SECONDS = getattr(settings, 'TYPEAHEAD_VERSION_CHECK_SECONDS', 5)
+TYPEAHEAD_MAX_AGE_SECONDS = getattr(settings, 'TYPEAHEAD_MAX_AGE_SECONDS', 300)
+# Distinct queries whose results are kept per index.
+TYPEAHEAD_CACHED_QUERIES = getattr(settings, 'TYPEAHEAD_CACHED_QUERIES', 4096)
+
+# Result types in the order they are ranked when matches are otherwise equal.
+TYPES = ('notebook', 'brand', 'notebook_type', 'size', 'ruling')
+TYPE_ORDER = {name: rank for rank, name in enumerate(TYPES)}
+
+_WORD = re.compile(r'\w+')
+
+
+def tokenize(text):
+    """Case- and accent-insensitive words of `text`"""
+    text = ''.join(c for c in unicodedata.normalize('NFKD', text) if not unicodedata.combining(c))
+    return _WORD.findall(text.casefold())
+
+
+def load_entries():
+    """Every suggestion as a dict of type, slug, label and detail"""
+    entries = [
+        {'type': 'notebook', 'slug': slug, 'label': name, 'detail': brand}
+        for slug, name, brand in Notebook.objects.active().order_by().values_list('slug', 'name', 'brand__name')
+    ]
+    for type_name, queryset in (
+        ('brand', Brand.objects.active()),
+        ('notebook_type', NotebookType.objects.all()),
+        ('size', Size.objects.all()),
+        ('ruling', Ruling.objects.all()),
+    ):
+        entries.extend(
+            {'type': type_name, 'slug': slug, 'label': name, 'detail': ''}
+            for slug, name in queryset.order_by().values_list('slug', 'name')
+        )
+    return entries
+
+
+def catalog_version():
+    return CatalogChange.objects.order_by('-seq').values_list('seq', flat=True).first() or 0
+
+
+class PrefixIndex:
+    """
+    Sorted array of keys built from the suggestion labels, with the rank of
+    each key precomputed so a query only has to pick the best of its range.
+    Results are memoised per query since the index never changes once built.
+    """
+
+    def __init__(self, entries, version=None):
+        self.version = version
+        self.built_at = time.monotonic()
+        self.entries = entries
+        rows = []
+        for number, entry in enumerate(entries):
+            words = tokenize(entry['label'])
+            for start in range(len(words)):
+                # Matches at the start of the label first, then by type, then shorter labels.
+                rank = (start > 0, TYPE_ORDER[entry['type']], len(entry['label']), entry['label'], number)
+                rows.append((' '.join(words[start:]), rank))
+        rows.sort()
+        self.keys = [key for key, _ in rows]
+        self.ranks = [rank for _, rank in rows]
+        self._results = {}
+
+    def search(self, query, limit=TYPEAHEAD_DEFAULT_RESULTS, types=None):
+        """Entries with a word sequence starting with `query`, best first"""
+        prefix = ' '.join(tokenize(query))
+        if not prefix:
+            return []
+        cache_key = (prefix, limit, frozenset(types) if types else None)
+        results = self._results.get(cache_key)
+        if results is not None:
+            return results
+
+        first = bisect_left(self.keys, prefix)
+        last = bisect_left(self.keys, prefix + '\U0010ffff', first)
+        ranks = self.ranks[first:last]
+        if types:
+            ranks = [rank for rank in ranks if self.entries[rank[-1]]['type'] in types]
+        # An entry can match at several word positions, so look a little past
+        # `limit` and only sort the whole range if duplicates ate into it.
+        results = self._distinct_entries(heapq.nsmallest(limit * 2, ranks), limit)
+        if len(results) < limit and len(ranks) > limit * 2:
+            results = self._distinct_entries(sorted(ranks), limit)
+
+        if len(self._results) >= TYPEAHEAD_CACHED_QUERIES:
+            self._results.clear()
+        self._results[cache_key] = results
+        return results
+
+    def _distinct_entries(self, ranks, limit):
+        results, seen = [], set()
+        for rank in ranks:
+            number = rank[-1]
+            if number not in seen:
+                seen.add(number)
+                results.append(self.entries[number])
+                if len(results) == limit:
+                    break
+        return results
+
+
+_index = None
+_checked_at = None
+_lock = threading.Lock()
+
+
+def get_index():
+    """The process-wide index, rebuilt when the catalog version has changed"""
+    global _index, _checked_at
+    now = time.monotonic()
+    if _index is not None and now - _checked_at < TYPEAHEAD_VERSION_CHECK_SECONDS:
+        return _index
+    with _lock:
+        if _index is None or now - _checked_at >= TYPEAHEAD_VERSION_CHECK_SECONDS:
+            with reading_from_replica(False):
+                version = catalog_version()
+                if _index is None or _index.version != version or now - _index.built_at >= TYPEAHEAD_MAX_AGE_SECONDS:
+                    _index = PrefixIndex(load_entries(), version)
+            _checked_at = time.monotonic()
+    return _index
+
+
+def reset_index():
+    """Drop the index so the next request rebuilds it, for tests"""
+    global _index
+    with _lock:
+        _index = None
+
+
+def parse_types(value):
+    if not value:
+        return None
+    types = {name.strip() for name in value.split(',') if name.strip()}
+    unknown = types - set(TYPES)
+    if unknown:
+        raise ValidationError({'types': [f'Unknown types: {", ".join(sorted(unknown))}. Use {", ".join(TYPES)}.']})
+    return types
+
+
+def parse_limit(value):
+    if value in (None, ''):
+        return TYPEAHEAD_DEFAULT_RESULTS
+    try:
+        limit = int(value)
+    except (TypeError, ValueError):
+        limit = 0
+    if not 0 < limit <= TYPEAHEAD_MAX_RESULTS:
+        raise ValidationError({'limit': [f'Limit must be between 1 and {TYPEAHEAD_MAX_RESULTS}.']})
+    return limit
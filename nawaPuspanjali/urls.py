@@ -1,7 +1,7 @@
 # urls.py
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import NotebookViewSet, NotebookVariantViewSet, filter_options
+from .views import NotebookViewSet, NotebookVariantViewSet, filter_options, quote, changes, typeahead
 
 router = DefaultRouter()
 router.register(r'notebooks', NotebookViewSet, basename='notebook')
@@ -10,4 +10,7 @@ router.register(r'notebook-variants', NotebookVariantViewSet, basename='notebook
 urlpatterns = [
     path('api/', include(router.urls)),
     path('api/filter-options/', filter_options, name='filter-options'),
+    path('api/quote/', quote, name='quote'),
+    path('api/changes/', changes, name='changes'),
+    path('api/typeahead/', typeahead, name='typeahead'),
 ]
\ No newline at end of file
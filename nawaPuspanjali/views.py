@@ -1,18 +1,33 @@
 # views.py
+from django.db.models import Q
 from rest_framework import viewsets, filters
+from rest_framework.decorators import action
+from rest_framework.response import Response
 from django_filters.rest_framework import DjangoFilterBackend
-from .models import *
-from .serializers import BrandSerializer, NotebookDetailSerializer, NotebookListSerializer, NotebookTypeSerializer, NotebookVariantListSerializer, NotebookVariantDetailSerializer, RulingSerializer, SizeSerializer
+from .models import Brand, Notebook, NotebookType, NotebookVariant, Ruling, SimilarNotebook, Size
+from .serializers import BrandSerializer, NotebookDetailSerializer, NotebookListSerializer, NotebookTypeSerializer, NotebookVariantListSerializer, NotebookVariantDetailSerializer, RulingSerializer, SimilarNotebookSerializer, SizeSerializer, VariantBatchRequestSerializer
 from .filters import NotebookVariantFilter, NotebookFilter
+from .db_router import ReplicaReadMixin, replica_reads
+from .query_budget import query_budget
+from .pricing import build_quote, parse_quote_lines
+from .changes import build_change_feed, parse_cursor, parse_limit
+from . import typeahead as typeahead_index
+
+# Relations every variant payload needs; shared by the list/detail queryset
+# and the batch lookup so both stay a single joined query.
+VARIANT_RELATED = (
+    'notebook',
+    'notebook__brand',
+    'notebook__notebook_type',
+    'size',
+    'ruling',
+)
+
 
-class NotebookVariantViewSet(viewsets.ReadOnlyModelViewSet):
-    queryset = NotebookVariant.objects.select_related(
-        'notebook', 
-        'notebook__brand', 
-        'notebook__notebook_type',
-        'size', 
-        'ruling'
-    ).filter(is_active=True, notebook__is_active=True)
+class NotebookVariantViewSet(ReplicaReadMixin, viewsets.ReadOnlyModelViewSet):
+    queryset = NotebookVariant.objects.active().select_related(
+        *VARIANT_RELATED
+    )
     
     serializer_class = NotebookVariantListSerializer
     filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
@@ -22,19 +37,76 @@ class NotebookVariantViewSet(viewsets.ReadOnlyModelViewSet):
     ordering = ['notebook__brand__name', 'notebook__name', 'size__display_order']
     lookup_field = 'slug'
     lookup_url_kwarg = 'slug'
+    # Queries per request, including the session and user lookups of a
+    # logged-in client; enforced in tests by query_budget.py.
+    query_budget = {'list': 3, 'retrieve': 4, 'batch': 4}
     
-    def get_serializer_class(self):
+    def get_queryset(self):
+        queryset = super().get_queryset()
         if self.action == 'retrieve':
+            queryset = queryset.prefetch_related('price_tiers')
+        return queryset
+
+    def get_serializer_class(self):
+        if self.action in ('retrieve', 'batch'):
             return NotebookVariantDetailSerializer
         return NotebookVariantListSerializer
 
+    @action(detail=False, methods=['get', 'post'])
+    def batch(self, request):
+        """
+        Look up many variants in one query.
+        Accepts `slugs` and/or `ids` (JSON body on POST, comma separated on GET)
+        and returns the found variants in request order, plus the identifiers
+        that do not exist and those that exist but are not purchasable.
+        """
+        if request.method == 'GET':
+            data = {
+                key: [item for item in request.query_params.get(key, '').split(',') if item]
+                for key in ('slugs', 'ids')
+            }
+        else:
+            data = request.data
+        params = VariantBatchRequestSerializer(data=data)
+        params.is_valid(raise_exception=True)
+        slugs = params.validated_data['slugs']
+        ids = params.validated_data['ids']
 
-class NotebookViewSet(viewsets.ReadOnlyModelViewSet):
-    queryset = Notebook.objects.prefetch_related(
+        variants = NotebookVariant.objects.select_related(
+            *VARIANT_RELATED
+        ).prefetch_related('price_tiers').filter(Q(slug__in=slugs) | Q(pk__in=ids)).order_by()
+        by_slug = {}
+        by_id = {}
+        for variant in variants:
+            by_slug[variant.slug] = variant
+            by_id[variant.pk] = variant
+
+        results, missing, inactive = [], [], []
+        seen = set()
+        requested = [(key, by_slug.get(key)) for key in slugs] + [(key, by_id.get(key)) for key in ids]
+        for key, variant in requested:
+            if variant is None:
+                missing.append(key)
+            elif not (variant.is_active and variant.notebook.is_active):
+                inactive.append(key)
+            elif variant.pk not in seen:
+                seen.add(variant.pk)
+                results.append(variant)
+
+        serializer = self.get_serializer(results, many=True)
+        return Response({
+            'results': serializer.data,
+            'missing': missing,
+            'inactive': inactive,
+        })
+
+
+class NotebookViewSet(ReplicaReadMixin, viewsets.ReadOnlyModelViewSet):
+    queryset = Notebook.objects.active().prefetch_related(
         'variants',
         'variants__size',
         'variants__ruling'
-    ).select_related('brand', 'notebook_type').filter(is_active=True)
+    ).select_related('brand', 'notebook_type')
     
     serializer_class = NotebookListSerializer
     filterset_class = NotebookFilter
@@ -43,23 +115,83 @@ class NotebookViewSet(viewsets.ReadOnlyModelViewSet):
     ordering_fields = ['name', 'brand__name']
     ordering = ['brand__name', 'name']
     lookup_field = 'slug'
+    query_budget = {'list': 6, 'retrieve': 7, 'similar': 3}
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action == 'retrieve':
+            queryset = queryset.prefetch_related('variants__price_tiers')
+        return queryset
     
     def get_serializer_class(self):
         if self.action == 'retrieve':
             return NotebookDetailSerializer
         return NotebookListSerializer
 
+    @action(detail=True)
+    def similar(self, request, slug=None):
+        """Precomputed similar notebooks, served from one indexed lookup"""
+        neighbours = SimilarNotebook.objects.select_related(
+            'similar', 'similar__brand', 'similar__notebook_type'
+        ).filter(
+            notebook__slug=slug, notebook__is_active=True, similar__is_active=True
+        ).order_by('rank')
+        return Response(SimilarNotebookSerializer(neighbours, many=True).data)
+
 
 # Filter options endpoint
 from rest_framework.decorators import api_view
-from rest_framework.response import Response
 
+@query_budget(6)
+@replica_reads
 @api_view(['GET'])
 def filter_options(request):
     """Return all available filter options"""
     return Response({
-        'brands': BrandSerializer(Brand.objects.filter(is_active=True), many=True).data,
+        'brands': BrandSerializer(Brand.objects.active(), many=True).data,
         'notebook_types': NotebookTypeSerializer(NotebookType.objects.all(), many=True).data,
         'sizes': SizeSerializer(Size.objects.all(), many=True).data,
         'rulings': RulingSerializer(Ruling.objects.all(), many=True).   data,
-    })
\ No newline at end of file
+    })
+
+
+@query_budget(3)
+@api_view(['POST'])
+def quote(request):
+    """
+    Price an order of {"variant": <slug or id>, "quantity": <int>} lines,
+    applying quantity tiers on each variant's total quantity
+    """
+    return Response(build_quote(parse_quote_lines(request.data)))
+
+
+@query_budget(10)
+@api_view(['GET'])
+def changes(request):
+    """
+    Catalog rows created, updated or deleted after `since`.
+    Start from since=0 and pass back `next_cursor` until `has_more` is false.
+    """
+    since = parse_cursor(request.query_params.get('since'))
+    limit = parse_limit(request.query_params.get('limit'))
+    return Response(build_change_feed(since, limit, context={'request': request}))
+
+
+# A rebuild: version check plus one query per suggestion type, and the
+# session lookups of a logged-in client. Otherwise no queries at all.
+@query_budget(8)
+@replica_reads
+@api_view(['GET'])
+def typeahead(request):
+    """
+    Search box suggestions for `q` from the in-memory prefix index: notebooks,
+    brands, types, sizes and rulings whose name has a word run starting with
+    `q`. Narrow with `types=notebook,brand` and `limit`.
+    """
+    query = request.query_params.get('q', '')
+    limit = typeahead_index.parse_limit(request.query_params.get('limit'))
+    types = typeahead_index.parse_types(request.query_params.get('types'))
+    return Response({
+        'query': query,
+        'results': typeahead_index.get_index().search(query, limit, types),
+    })
@@ -0,0 +1,18 @@
+# predeploy.sh
+# Apply migrations once per release, before the new web containers start
+# (release phase / pre-deploy job), while the old release keeps serving.
+# Large-table changes use the operations in nawaPuspanjali/migration_ops.py.
+
+# A DDL statement waiting for a lock blocks every query queued behind it, so
+# give up quickly on PostgreSQL and retry instead of stalling catalog reads.
+export PGOPTIONS="${PGOPTIONS:--c lock_timeout=${MIGRATE_LOCK_TIMEOUT:-5s}}"
+
+attempt=1
+until python manage.py migrate --noinput; do
+    if [ "$attempt" -ge "${MIGRATE_ATTEMPTS:-5}" ]; then
+        echo "migrate failed after $attempt attempts" >&2
+        exit 1
+    fi
+    attempt=$((attempt + 1))
+    sleep "${MIGRATE_RETRY_DELAY:-10}"
+done
@@ -67,6 +67,7 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'corsheaders.middleware.CorsMiddleware',
+    'nawaPuspanjali.throttling.LoadSheddingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',   
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -75,6 +76,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'nawaPuspanjali.db_router.PrimaryPinningMiddleware',
 ]
 
 ROOT_URLCONF = 'puspanjali_backend.urls'
@@ -114,6 +116,59 @@ DATABASES = {
 database_url = os.getenv('DATABASE_URL')
 DATABASES["default"] = dj_database_url.parse(database_url)
 
+# Optional read replicas, comma separated. Catalog reads are spread over
+# them by nawaPuspanjali.db_router; writes and the admin stay on default.
+REPLICA_DATABASE_URLS = [url for url in get_list('REPLICA_DATABASE_URLS') if url]
+for index, replica_url in enumerate(REPLICA_DATABASE_URLS):
+    DATABASES[f'replica_{index}'] = dj_database_url.parse(replica_url)
+    DATABASES[f'replica_{index}']['TEST'] = {'MIRROR': 'default'}
+
+DATABASE_ROUTERS = ['nawaPuspanjali.db_router.ReplicaRouter']
+REPLICA_PIN_SECONDS = int(os.getenv('REPLICA_PIN_SECONDS', '10'))
+REPLICA_HEALTH_CHECK_INTERVAL = int(os.getenv('REPLICA_HEALTH_CHECK_INTERVAL', '5'))
+REPLICA_MAX_LAG_SECONDS = int(os.getenv('REPLICA_MAX_LAG_SECONDS', '30'))
+
+# Where `manage.py dispatch_outbox` delivers catalog change events.
+OUTBOX_SINKS = [
+    {'BACKEND': 'nawaPuspanjali.outbox.HttpSink', 'OPTIONS': {'url': url}}
+    for url in get_list('OUTBOX_WEBHOOK_URLS') if url
+]
+if os.getenv('OUTBOX_FILE'):
+    OUTBOX_SINKS.append({'BACKEND': 'nawaPuspanjali.outbox.FileSink', 'OPTIONS': {'path': os.getenv('OUTBOX_FILE')}})
+
+# Notebook images saved in the admin wait under MEDIA_ROOT until
+# `manage.py process_image_uploads` sends them to this uploader.
+IMAGE_UPLOADER = os.getenv('IMAGE_UPLOADER', 'nawaPuspanjali.images.CloudinaryUploader')
+
+# Catalog API throttling, see nawaPuspanjali/throttling.py. Rates are in
+# request cost units; an empty rate disables that limit.
+REST_FRAMEWORK = {
+    'DEFAULT_THROTTLE_CLASSES': [
+        'nawaPuspanjali.throttling.CatalogClientThrottle',
+        'nawaPuspanjali.throttling.CatalogGlobalThrottle',
+    ],
+    # Proxies in front of the app whose X-Forwarded-For entries are trusted.
+    # 0 (the default) identifies clients by REMOTE_ADDR only, since with None
+    # DRF would take the raw header and a client could send a new key with
+    # every request. Behind a proxy set it, or every client shares its address.
+    'NUM_PROXIES': int(os.getenv('NUM_PROXIES', '0')),
+}
+CATALOG_THROTTLE_RATES = {
+    'client': os.getenv('CATALOG_THROTTLE_CLIENT_RATE', '600/min'),
+    'global': os.getenv('CATALOG_THROTTLE_GLOBAL_RATE', '20000/min'),
+}
+# Share the limits between workers through a cache instead of per process.
+if os.getenv('THROTTLE_REDIS_URL'):
+    CACHES = {
+        'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+        'throttle': {'BACKEND': 'django.core.cache.backends.redis.RedisCache', 'LOCATION': os.getenv('THROTTLE_REDIS_URL')},
+    }
+    CATALOG_THROTTLE_CACHE = 'throttle'
+
+# Shed API requests with a 503 when a worker is saturated; 0 turns a check off.
+LOAD_SHED_MAX_INFLIGHT = int(os.getenv('LOAD_SHED_MAX_INFLIGHT', '0'))
+LOAD_SHED_MAX_QUEUE_MS = int(os.getenv('LOAD_SHED_MAX_QUEUE_MS', '0'))
+
 
 
 # Password validation
@@ -178,6 +233,11 @@ STORAGES = {
 }
 
 
+# Fails tests whose requests go over their view's query budget or repeat a
+# statement (N+1), see nawaPuspanjali/query_budget.py.
+TEST_RUNNER = 'nawaPuspanjali.runner.QueryBudgetTestRunner'
+
+
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'